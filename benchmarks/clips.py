@@ -0,0 +1,56 @@
+"""
+Clipes de áudio sintéticos usados pelo benchmark.
+
+Os arquivos ficam versionados em benchmarks/clips/; este módulo só existe para
+regerá-los de forma determinística:
+    python -m benchmarks.clips
+"""
+import math
+import random
+import struct
+import wave
+from pathlib import Path
+
+CLIPS_DIR = Path(__file__).parent / 'clips'
+SAMPLE_RATE = 8000
+
+# nome -> duração em segundos (fala curta, média e longa de um aprendiz)
+CLIP_DURATIONS = {
+    'short_1s.wav': 1.0,
+    'medium_3s.wav': 3.0,
+    'long_6s.wav': 6.0,
+}
+
+
+def write_clip(path, seconds, seed=0):
+    """Escreve um WAV mono 16-bit com tons variando, parecido com a envoltória da fala"""
+    rng = random.Random(seed)
+    frames = bytearray()
+    freq = 180.0
+    for i in range(int(seconds * SAMPLE_RATE)):
+        if i % 800 == 0:
+            freq = rng.uniform(120.0, 300.0)
+        envelope = 0.5 * (1 - math.cos(2 * math.pi * (i % 2400) / 2400))
+        sample = 0.3 * envelope * math.sin(2 * math.pi * freq * i / SAMPLE_RATE)
+        frames += struct.pack('<h', int(sample * 32767))
+    with wave.open(str(path), 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(SAMPLE_RATE)
+        wf.writeframes(bytes(frames))
+
+
+def generate_clips():
+    CLIPS_DIR.mkdir(exist_ok=True)
+    for seed, (name, seconds) in enumerate(CLIP_DURATIONS.items()):
+        write_clip(CLIPS_DIR / name, seconds, seed)
+
+
+def list_clips():
+    """Retorna os clipes disponíveis, do mais curto ao mais longo"""
+    return [CLIPS_DIR / name for name in CLIP_DURATIONS if (CLIPS_DIR / name).exists()]
+
+
+if __name__ == '__main__':
+    generate_clips()
+    print(f"Clipes gerados em {CLIPS_DIR}")
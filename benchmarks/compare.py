@@ -0,0 +1,59 @@
+"""
+Compara dois resultados do benchmark (JSON gerado por benchmarks.load_test).
+
+Uso:
+    python -m benchmarks.compare benchmarks/results/base.json benchmarks/results/novo.json
+"""
+import argparse
+import json
+
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'requests_per_sec')
+
+
+def _delta(before, after):
+    if before in (None, 0) or after is None:
+        return '-'
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def compare_rows(base, new):
+    """Gera (nome, métrica, antes, depois, variação) para endpoints e etapas presentes nos dois"""
+    rows = []
+    for phase, data in new.get('phases', {}).items():
+        base_endpoints = base.get('phases', {}).get(phase, {}).get('endpoints', {})
+        for name, stats in data['endpoints'].items():
+            if name in base_endpoints:
+                for metric in METRICS:
+                    before, after = base_endpoints[name].get(metric), stats.get(metric)
+                    rows.append((f"{phase}/{name}", metric, before, after, _delta(before, after)))
+        base_peak = ((base.get('phases', {}).get(phase) or {}).get('memory') or {}).get('rss_peak_mb')
+        new_peak = (data.get('memory') or {}).get('rss_peak_mb')
+        if base_peak and new_peak:
+            rows.append((phase, 'rss_peak_mb', base_peak, new_peak, _delta(base_peak, new_peak)))
+    for name, stats in new.get('stages', {}).items():
+        if name in base.get('stages', {}):
+            for metric in ('p50_ms', 'p95_ms'):
+                before, after = base['stages'][name].get(metric), stats.get(metric)
+                rows.append((f"stage/{name}", metric, before, after, _delta(before, after)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compara dois resultados do benchmark do Speakly')
+    parser.add_argument('base')
+    parser.add_argument('new')
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    print(f"{'':<40}{'métrica':<18}{'antes':>10}{'depois':>10}{'variação':>10}")
+    for name, metric, before, after, delta in compare_rows(base, new):
+        fmt = lambda v: '-' if v is None else f"{v:.1f}"
+        print(f"{name:<40}{metric:<18}{fmt(before):>10}{fmt(after):>10}{delta:>10}")
+
+
+if __name__ == '__main__':
+    main()
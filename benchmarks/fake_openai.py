@@ -0,0 +1,258 @@
+"""
+Servidor local que imita a API da OpenAI para benchmarks offline.
+
+Implementa apenas as rotas usadas pelo Speakly (transcrição, chat com tool calls,
+síntese de fala e embeddings), com latência e jitter configuráveis por rota.
+
+Uso:
+    python -m benchmarks.fake_openai --port 8765 --latency chat=0.6 --jitter 0.2
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latência média (segundos) de cada rota, próxima do observado na API real
+DEFAULT_LATENCIES = {
+    'transcriptions': 0.5,
+    'chat': 0.8,
+    'speech': 0.7,
+    'embeddings': 0.15,
+}
+
+EMBEDDING_DIMENSION = 1536
+
+CHAT_REPLIES = [
+    "你好！今天天气很好，你想去哪里？",
+    "我很喜欢喝茶。你喜欢喝什么？",
+    "你的中文说得很好！你学中文多长时间了？",
+    "我们明天一起去吃饭，好吗？",
+]
+
+ROUTES = {
+    '/v1/audio/transcriptions': 'transcriptions',
+    '/v1/chat/completions': 'chat',
+    '/v1/audio/speech': 'speech',
+    '/v1/embeddings': 'embeddings',
+}
+
+
+class FakeOpenAIServer:
+    """
+    Servidor HTTP em thread própria com respostas sintéticas compatíveis com o SDK da OpenAI
+    """
+
+    def __init__(self, host='127.0.0.1', port=8765, latencies=None, jitter=0.1,
+                 tool_call_rate=1.0, seed=None):
+        self.latencies = dict(DEFAULT_LATENCIES)
+        self.latencies.update(latencies or {})
+        self.jitter = jitter
+        self.tool_call_rate = tool_call_rate
+        self.random = random.Random(seed)
+        self.calls = {route: 0 for route in DEFAULT_LATENCIES}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def delay(self, route):
+        """Dorme a latência configurada da rota (média ± jitter, nunca negativa)"""
+        with self._lock:
+            self.calls[route] += 1
+            offset = self.random.uniform(-self.jitter, self.jitter)
+        time.sleep(max(0.0, self.latencies.get(route, 0.0) + offset))
+
+    def should_call_tool(self):
+        with self._lock:
+            return self.random.random() < self.tool_call_rate
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass  # Silencia o log por requisição
+
+            def do_POST(self):
+                route = ROUTES.get(self.path.split('?')[0])
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if route is None:
+                    return self._send_json({'error': {'message': f'Rota não suportada: {self.path}'}}, 404)
+
+                server.delay(route)
+                if route == 'transcriptions':
+                    return self._send_json({'text': 'Hello, I would like to practice my Chinese today.'})
+                if route == 'speech':
+                    return self._send_bytes(fake_mp3(body), 'audio/mpeg')
+
+                payload = json.loads(body or b'{}')
+                if route == 'chat':
+                    return self._send_json(chat_completion(payload, server.should_call_tool()))
+                return self._send_json(embeddings(payload))
+
+            def _send_json(self, data, status=200):
+                self._send_bytes(json.dumps(data, ensure_ascii=False).encode('utf-8'),
+                                 'application/json', status)
+
+            def _send_bytes(self, data, content_type, status=200):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def _estimate_tokens(text):
+    # Aproximação grosseira: ~4 caracteres por token
+    return max(1, len(text) // 4)
+
+
+def chat_completion(payload, call_tool):
+    """Monta uma resposta de chat; com `tools` e última mensagem do usuário, pede a ferramenta"""
+    messages = payload.get('messages', [])
+    prompt_text = "".join(str(m.get('content') or '') for m in messages)
+    last = messages[-1] if messages else {}
+    message = {'role': 'assistant', 'content': None}
+    finish_reason = 'stop'
+
+    if payload.get('tools') and last.get('role') == 'user' and call_tool:
+        tool_name = payload['tools'][0].get('function', {}).get('name', 'retrieve')
+        message['tool_calls'] = [{
+            'id': f"call_{uuid.uuid4().hex[:12]}",
+            'type': 'function',
+            'function': {'name': tool_name, 'arguments': json.dumps({'query': str(last.get('content', ''))})},
+        }]
+        finish_reason = 'tool_calls'
+    else:
+        seed = int(hashlib.md5(prompt_text.encode('utf-8')).hexdigest(), 16)
+        message['content'] = CHAT_REPLIES[seed % len(CHAT_REPLIES)]
+
+    completion_text = message['content'] or json.dumps(message.get('tool_calls'))
+    prompt_tokens = _estimate_tokens(prompt_text)
+    completion_tokens = _estimate_tokens(completion_text)
+    return {
+        'id': f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': payload.get('model', 'gpt-4o-mini'),
+        'choices': [{'index': 0, 'message': message, 'finish_reason': finish_reason}],
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def _fake_vector(text):
+    """Vetor determinístico (mesmo texto -> mesmo vetor) para buscas reproduzíveis"""
+    rng = random.Random(hashlib.md5(text.encode('utf-8')).hexdigest())
+    return [rng.uniform(-1.0, 1.0) for _ in range(EMBEDDING_DIMENSION)]
+
+
+def embeddings(payload):
+    """Gera embeddings; aceita strings ou listas de tokens e o formato base64 do SDK"""
+    inputs = payload.get('input', [])
+    if not isinstance(inputs, list) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+    as_base64 = payload.get('encoding_format') == 'base64'
+
+    data = []
+    for i, item in enumerate(inputs):
+        vector = _fake_vector(json.dumps(item, ensure_ascii=False))
+        if as_base64:
+            vector = base64.b64encode(struct.pack(f'<{len(vector)}f', *vector)).decode('ascii')
+        data.append({'object': 'embedding', 'index': i, 'embedding': vector})
+
+    tokens = sum(len(item) if isinstance(item, list) else _estimate_tokens(item) for item in inputs)
+    return {
+        'object': 'list',
+        'data': data,
+        'model': payload.get('model', 'text-embedding-ada-002'),
+        'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+    }
+
+
+def fake_mp3(body):
+    """Bytes de 'áudio' com tamanho proporcional ao texto (~1KB por caractere falado)"""
+    try:
+        text = json.loads(body or b'{}').get('input', '')
+    except ValueError:
+        text = ''
+    return b'ID3' + b'\x00' * (1024 * max(1, len(text)))
+
+
+def parse_route_values(values):
+    """Converte argumentos 'rota=valor' em dicionário"""
+    parsed = {}
+    for value in values or []:
+        route, _, seconds = value.partition('=')
+        if route not in DEFAULT_LATENCIES:
+            raise argparse.ArgumentTypeError(f"Rota desconhecida: {route}. Use {', '.join(DEFAULT_LATENCIES)}")
+        parsed[route] = float(seconds)
+    return parsed
+
+
+def add_server_arguments(parser):
+    parser.add_argument('--fake-host', default='127.0.0.1')
+    parser.add_argument('--fake-port', type=int, default=8765)
+    parser.add_argument('--latency', action='append', metavar='ROTA=SEGUNDOS',
+                        help=f"Latência média por rota ({', '.join(DEFAULT_LATENCIES)})")
+    parser.add_argument('--jitter', type=float, default=0.1, help='Variação máxima (±s) da latência')
+    parser.add_argument('--tool-call-rate', type=float, default=1.0,
+                        help='Fração dos turnos em que o chat pede a ferramenta de recuperação')
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def server_from_args(args):
+    return FakeOpenAIServer(
+        host=args.fake_host,
+        port=args.fake_port,
+        latencies=parse_route_values(args.latency),
+        jitter=args.jitter,
+        tool_call_rate=args.tool_call_rate,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor falso compatível com a API da OpenAI')
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = server_from_args(args)
+    print(f"Fake OpenAI ouvindo em {server.base_url} (latências: {server.latencies})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
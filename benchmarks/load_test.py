@@ -0,0 +1,408 @@
+"""
+Benchmark ponta a ponta do Speakly sem custo de API.
+
+Sobe o servidor falso da OpenAI (benchmarks.fake_openai), inicia o Speakly
+apontando para ele e dispara N usuários sintéticos concorrentes contra
+/api/stop_recording, /api/translate e os endpoints de sessão. Cada fase reporta
+p50/p95/p99, requisições/s e memória (RSS) do processo do Speakly; as etapas
+internas vêm do header Server-Timing. A memória é medida por fase (processo
+inteiro, com as etapas rodando concorrentemente), não por etapa. O resultado é salvo em JSON para comparar
+execuções com `python -m benchmarks.compare`.
+
+Uso:
+    python -m benchmarks.load_test --users 8 --iterations 10
+    python -m benchmarks.load_test --target http://127.0.0.1:5000 --server-pid 1234
+"""
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+from benchmarks.clips import list_clips
+from benchmarks.fake_openai import add_server_arguments, server_from_args
+
+ROOT_DIR = Path(__file__).parent.parent.resolve()
+RESULTS_DIR = Path(__file__).parent / 'results'
+
+PHASES = ('sessions', 'stop_recording', 'translate')
+
+TRANSLATE_SAMPLES = [
+    "你好，我叫小明。",
+    "今天天气很好，我们去公园吧。",
+    "你喜欢吃中国菜吗？我最喜欢饺子。",
+    "我学中文学了两年了，但是说得还不太好。",
+]
+
+
+def percentile(values, pct):
+    """Percentil por ranking mais próximo (values não precisa estar ordenado)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies_ms):
+    return {
+        'count': len(latencies_ms),
+        'mean_ms': sum(latencies_ms) / len(latencies_ms) if latencies_ms else None,
+        'p50_ms': percentile(latencies_ms, 50),
+        'p95_ms': percentile(latencies_ms, 95),
+        'p99_ms': percentile(latencies_ms, 99),
+        'max_ms': max(latencies_ms) if latencies_ms else None,
+    }
+
+
+def parse_server_timing(header):
+    """'stt;dur=12.3, tts;dur=4.0' -> [('stt', 12.3), ('tts', 4.0)]"""
+    timings = []
+    for entry in (header or '').split(','):
+        name, _, params = entry.strip().partition(';')
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if name and key == 'dur':
+                timings.append((name, float(value)))
+    return timings
+
+
+def _read_proc_kb(path, field):
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def read_rss_mb(pid):
+    """RSS atual do processo em MB (Linux, via /proc); None se indisponível"""
+    kb = _read_proc_kb(f'/proc/{pid}/status', 'VmRSS:')
+    return kb / 1024.0 if kb is not None else None
+
+
+def read_pss_mb(pid):
+    """PSS (memória compartilhada dividida entre os processos) em MB; None se indisponível"""
+    kb = _read_proc_kb(f'/proc/{pid}/smaps_rollup', 'Pss:')
+    return kb / 1024.0 if kb is not None else None
+
+
+def child_pids(pid):
+    """PIDs dos filhos diretos (ex: workers do gunicorn) lendo o ppid em /proc"""
+    children = []
+    for entry in os.listdir('/proc') if os.path.isdir('/proc') else []:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # O nome do processo pode conter espaços; o ppid vem logo após o ')'
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+
+class RssSampler:
+    """
+    Amostra a memória do servidor (processo principal + workers) em background
+    para obter o pico de cada fase e a média por worker. É uma medida do processo
+    todo: não separa quanto cada etapa (STT, LLM, TTS) alocou.
+    """
+
+    def __init__(self, pid, interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        workers = child_pids(self.pid)
+        rss = [read_rss_mb(p) for p in [self.pid] + workers]
+        pss = [read_pss_mb(p) for p in [self.pid] + workers]
+        if rss[0] is None:
+            return None
+        worker_rss = [v for v in rss[1:] if v is not None]
+        worker_pss = [v for v in pss[1:] if v is not None]
+        return {
+            'rss': sum(v for v in rss if v is not None),
+            'pss': sum(v for v in pss if v is not None) if pss[0] is not None else None,
+            'workers': len(workers),
+            'worker_rss': sum(worker_rss) / len(worker_rss) if worker_rss else None,
+            'worker_pss': sum(worker_pss) / len(worker_pss) if worker_pss else None,
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            sample = self._sample()
+            if sample is not None:
+                self.samples.append(sample)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if self.pid:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def summary(self):
+        if not self.samples:
+            return None
+
+        def peak(key):
+            values = [s[key] for s in self.samples if s[key] is not None]
+            return round(max(values), 1) if values else None
+
+        return {
+            'rss_start_mb': round(self.samples[0]['rss'], 1),
+            'rss_end_mb': round(self.samples[-1]['rss'], 1),
+            'rss_peak_mb': peak('rss'),
+            'pss_peak_mb': peak('pss'),
+            'workers': self.samples[-1]['workers'],
+            'rss_per_worker_mb': peak('worker_rss'),
+            'pss_per_worker_mb': peak('worker_pss'),
+        }
+
+
+class LoadTest:
+    def __init__(self, base_url, users, iterations, clips, server_pid=None, timeout=120.0):
+        self.base_url = base_url.rstrip('/')
+        self.users = users
+        self.iterations = iterations
+        self.clips = clips
+        self.server_pid = server_pid
+        self.timeout = timeout
+        self.records = []
+        self._lock = threading.Lock()
+
+    def _request(self, client, phase, endpoint, method, path, **kwargs):
+        start = time.perf_counter()
+        status, timings = None, []
+        try:
+            response = client.request(method, self.base_url + path, **kwargs)
+            status = response.status_code
+            timings = parse_server_timing(response.headers.get('Server-Timing'))
+            body = response.json() if response.headers.get('Content-Type', '').startswith('application/json') else None
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Erro em {path}: {e}")
+            body = None
+        latency_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.records.append({
+                'phase': phase,
+                'endpoint': endpoint,
+                'latency_ms': latency_ms,
+                'ok': status is not None and status < 400,
+                'status': status,
+                'server_timing': timings,
+            })
+        return body
+
+    def _sessions(self, client, user, iteration):
+        self._request(client, 'sessions', 'new_session', 'POST', '/api/new_session')
+        self._request(client, 'sessions', 'conversation_status', 'GET', '/api/conversation_status')
+        self._request(client, 'sessions', 'clear_memory', 'POST', '/api/clear_memory')
+
+    def _stop_recording(self, client, user, iteration):
+        clip = self.clips[(user + iteration) % len(self.clips)]
+        with open(clip, 'rb') as audio:
+            files = {'file': (f'bench_{user}_{iteration}_{clip.name}', audio, 'audio/wav')}
+            data = {'user_level': 'begginer', 'theme': 'conversacao-geral'}
+            self._request(client, 'stop_recording', 'stop_recording', 'POST', '/api/stop_recording',
+                          files=files, data=data)
+
+    def _translate(self, client, user, iteration):
+        text = TRANSLATE_SAMPLES[(user + iteration) % len(TRANSLATE_SAMPLES)]
+        self._request(client, 'translate', 'translate', 'POST', '/api/translate', json={'text': text})
+
+    def _run_user(self, action, user):
+        with httpx.Client(timeout=self.timeout) as client:
+            for iteration in range(self.iterations):
+                action(client, user, iteration)
+
+    def run_phase(self, phase):
+        action = getattr(self, f'_{phase}')
+        print(f"▶ Fase {phase}: {self.users} usuários x {self.iterations} iterações")
+        with RssSampler(self.server_pid) as sampler:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=self.users) as pool:
+                for future in [pool.submit(self._run_user, action, user) for user in range(self.users)]:
+                    future.result()
+            duration = time.perf_counter() - start
+        return duration, sampler.summary()
+
+    def report(self, phase_runs):
+        phases = {}
+        for phase, (duration, memory) in phase_runs.items():
+            records = [r for r in self.records if r['phase'] == phase]
+            endpoints = {}
+            for name in sorted({r['endpoint'] for r in records}):
+                endpoint_records = [r for r in records if r['endpoint'] == name]
+                stats = summarize([r['latency_ms'] for r in endpoint_records])
+                stats['errors'] = sum(1 for r in endpoint_records if not r['ok'])
+                stats['requests_per_sec'] = len(endpoint_records) / duration if duration else None
+                endpoints[name] = stats
+            phases[phase] = {
+                'duration_s': duration,
+                'requests': len(records),
+                'requests_per_sec': len(records) / duration if duration else None,
+                'memory': memory,
+                'endpoints': endpoints,
+            }
+
+        stage_values = {}
+        for record in self.records:
+            for name, duration_ms in record['server_timing']:
+                stage_values.setdefault(name, []).append(duration_ms)
+        stages = {name: summarize(values) for name, values in sorted(stage_values.items())}
+        return {'phases': phases, 'stages': stages}
+
+
+def start_speakly(port, fake_base_url, stt_provider, server='dev', workers=None):
+    """
+    Inicia o Speakly em um subprocesso apontando para o servidor falso:
+    'dev' usa o servidor do Flask, 'production' usa serve.py (gunicorn)
+    """
+    env = dict(os.environ)
+    env.update({
+        'OPENAI_API_KEY': 'sk-benchmark',
+        'OPENAI_BASE_URL': fake_base_url,
+        'OPENAI_API_BASE': fake_base_url,
+        'TTS_PROVIDER': 'openai',
+        'STT_PROVIDER': stt_provider,
+    })
+    if server == 'production':
+        env.update({'SPEAKLY_HOST': '127.0.0.1', 'SPEAKLY_PORT': str(port)})
+        if workers:
+            env['SPEAKLY_WORKERS'] = str(workers)
+        command = [sys.executable, 'serve.py']
+    else:
+        command = [sys.executable, '-m', 'flask', '--app', 'main', 'run',
+                   '--port', str(port), '--no-reload', '--no-debugger', '--with-threads']
+    return subprocess.Popen(command, cwd=str(ROOT_DIR), env=env)
+
+
+def wait_until_ready(base_url, process=None, timeout=120.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Speakly encerrou durante a inicialização (código {process.returncode})")
+        try:
+            if httpx.get(base_url + '/api/metrics', timeout=2.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Speakly não respondeu em {timeout}s")
+
+
+def print_summary(result):
+    for phase, data in result['phases'].items():
+        memory = data['memory'] or {}
+        if memory.get('workers'):
+            print(f"{phase}: {memory['workers']} workers, RSS/worker {memory['rss_per_worker_mb']}MB, "
+                  f"PSS/worker {memory['pss_per_worker_mb']}MB, RSS total {memory['rss_peak_mb']}MB")
+    print(f"\n{'fase/endpoint':<36}{'n':>6}{'err':>5}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>8}{'rss pico':>10}")
+    for phase, data in result['phases'].items():
+        peak = (data['memory'] or {}).get('rss_peak_mb')
+        for name, stats in data['endpoints'].items():
+            print(f"{phase + '/' + name:<36}{stats['count']:>6}{stats['errors']:>5}"
+                  f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}"
+                  f"{stats['requests_per_sec']:>8.2f}{(f'{peak:.0f}MB' if peak else '-'):>10}")
+    if result['stages']:
+        print(f"\n{'etapa (Server-Timing)':<36}{'n':>6}{'p50':>14}{'p95':>9}{'p99':>9}")
+        for name, stats in result['stages'].items():
+            print(f"{name:<36}{stats['count']:>6}{stats['p50_ms']:>14.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Benchmark e teste de carga offline do Speakly')
+    parser.add_argument('--users', type=int, default=4, help='Usuários sintéticos concorrentes')
+    parser.add_argument('--iterations', type=int, default=5, help='Requisições por usuário em cada fase')
+    parser.add_argument('--phases', default=','.join(PHASES), help=f"Fases a executar ({', '.join(PHASES)})")
+    parser.add_argument('--target', default=None,
+                        help='URL de um Speakly já em execução (não sobe servidor falso nem Speakly)')
+    parser.add_argument('--server-pid', type=int, default=None, help='PID do Speakly para medir memória com --target')
+    parser.add_argument('--port', type=int, default=5055, help='Porta do Speakly iniciado pelo benchmark')
+    parser.add_argument('--stt-provider', default='openai', choices=['openai', 'whisper'])
+    parser.add_argument('--server', default='dev', choices=['dev', 'production'],
+                        help="'production' sobe o Speakly com serve.py (gunicorn, vários workers)")
+    parser.add_argument('--workers', type=int, default=None, help='Workers do servidor de produção')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--label', default='', help='Rótulo livre salvo no resultado (ex: nome do branch)')
+    parser.add_argument('--output', default=None, help='Arquivo JSON de saída (padrão: benchmarks/results/)')
+    add_server_arguments(parser)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    phases = [p.strip() for p in args.phases.split(',') if p.strip()]
+    unknown = set(phases) - set(PHASES)
+    if unknown:
+        raise SystemExit(f"Fases desconhecidas: {', '.join(sorted(unknown))}")
+
+    clips = list_clips()
+    if not clips:
+        raise SystemExit("Nenhum clipe encontrado; gere com `python -m benchmarks.clips`")
+
+    fake_server, speakly = None, None
+    base_url, server_pid = args.target, args.server_pid
+    try:
+        if base_url is None:
+            fake_server = server_from_args(args).start()
+            speakly = start_speakly(args.port, fake_server.base_url, args.stt_provider,
+                                    args.server, args.workers)
+            base_url, server_pid = f'http://127.0.0.1:{args.port}', speakly.pid
+        wait_until_ready(base_url, speakly, args.timeout)
+
+        load_test = LoadTest(base_url, args.users, args.iterations, clips, server_pid, args.timeout)
+        phase_runs = {phase: load_test.run_phase(phase) for phase in phases}
+        result = load_test.report(phase_runs)
+    finally:
+        if speakly is not None:
+            speakly.terminate()
+            speakly.wait(timeout=30)
+        if fake_server is not None:
+            fake_server.stop()
+
+    result['meta'] = {
+        'label': args.label,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'users': args.users,
+        'iterations': args.iterations,
+        'stt_provider': args.stt_provider,
+        'server': args.server,
+        'workers': args.workers,
+        'target': args.target,
+        'fake_latencies': fake_server.latencies if fake_server else None,
+        'fake_jitter': args.jitter if fake_server else None,
+    }
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"bench_{datetime.now():%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2, ensure_ascii=False))
+
+    print_summary(result)
+    print(f"\nResultado salvo em {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Micro-benchmark do re-ranqueamento MMR (src.vector_db.mmr_select).
+
+Mede só a etapa de re-ranqueamento, com vetores aleatórios na dimensão dos
+embeddings da OpenAI, para os tamanhos de candidatos usados em `retrieval.fetch_k`.
+
+Uso:
+    python -m benchmarks.mmr_bench --sizes 10,20,50,100 --k 2
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from src.vector_db import mmr_select
+
+
+def bench(fetch_k, k, dimension, repeat, lambda_mult=0.5, seed=0):
+    """Melhor tempo (ms) e mediana (ms) de `repeat` execuções de mmr_select"""
+    rng = np.random.default_rng(seed)
+    query = rng.standard_normal(dimension, dtype=np.float32)
+    candidates = rng.standard_normal((fetch_k, dimension), dtype=np.float32)
+    # Cópia por execução, como acontece com os vetores reconstruídos do índice
+    timer = timeit.Timer(lambda: mmr_select(query, candidates.copy(), k, lambda_mult))
+    runs = np.array(timer.repeat(repeat=repeat, number=1)) * 1000
+    return float(runs.min()), float(np.median(runs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmark do re-ranqueamento MMR')
+    parser.add_argument('--sizes', default='10,20,50,100', help='Tamanhos de fetch_k separados por vírgula')
+    parser.add_argument('--k', type=int, default=2)
+    parser.add_argument('--dimension', type=int, default=1536)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'fetch_k':>8}{'k':>4}{'melhor (ms)':>14}{'mediana (ms)':>15}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        best, median = bench(size, args.k, args.dimension, args.repeat)
+        print(f"{size:>8}{args.k:>4}{best:>14.3f}{median:>15.3f}")
+
+
+if __name__ == '__main__':
+    main()
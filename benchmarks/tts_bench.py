@@ -0,0 +1,86 @@
+"""
+Benchmark dos providers de TTS (local/Piper, OpenAI, gTTS).
+
+Sintetiza as mesmas frases em chinês com cada provider disponível e mede o
+tempo total e, no provider local, o tempo até a primeira frase (o que o
+endpoint /api/tts_stream entrega antes do restante). Os áudios são gerados em
+um diretório temporário, apagado após cada medição, para que o cache de TTS não
+esconda o custo real e para não tocar nos arquivos já em cache em public/tts.
+
+Uso:
+    python -m benchmarks.tts_bench
+    python -m benchmarks.tts_bench --providers local,gtts --repeat 5
+"""
+import argparse
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from src import text_to_speech as tts  # noqa: E402
+
+PHRASES = [
+    "你好！",
+    "今天天气很好，我们去公园散步吧。",
+    "你周末喜欢做什么？我常常和朋友一起去看电影。",
+    "学习中文需要时间和耐心。每天练习一点点，你会进步得很快！你最近在学什么？",
+]
+
+
+def available_providers():
+    providers = {'local': tts.local_tts_available(), 'openai': tts.openai_client is not None, 'gtts': True}
+    return [name for name, available in providers.items() if available]
+
+
+def synthesize_once(provider, text):
+    """Tempo (s) para gerar o áudio em chinês sem cache, em um diretório temporário próprio"""
+    output_dir = Path(tempfile.mkdtemp(prefix="speakly-tts-bench-"))
+    cache_dir, tts.TTS_DIR = tts.TTS_DIR, output_dir
+    try:
+        start = time.perf_counter()
+        filename = tts.text_to_speech_with_quality(text, provider=provider, lang='zh-cn')
+        seconds = time.perf_counter() - start
+    finally:
+        tts.TTS_DIR = cache_dir
+        shutil.rmtree(output_dir, ignore_errors=True)
+    if not filename:
+        raise RuntimeError(f"{provider} não gerou áudio")
+    return seconds
+
+
+def first_sentence_latency(text):
+    """Tempo (s) até o PCM da primeira frase no provider local"""
+    start = time.perf_counter()
+    next(tts.synthesize_local_sentences(text))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dos providers de TTS')
+    parser.add_argument('--providers', help='Providers separados por vírgula (padrão: todos os disponíveis)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    providers = args.providers.split(',') if args.providers else available_providers()
+    if 'local' in providers:
+        tts.get_local_voice()  # carga do modelo fora da medição
+
+    print(f"{'provider':<8}{'chars':>6}{'mediana (s)':>13}{'1ª frase (s)':>14}")
+    for provider in providers:
+        for text in PHRASES:
+            try:
+                runs = [synthesize_once(provider, text) for _ in range(args.repeat)]
+            except Exception as e:
+                print(f"{provider:<8}{len(text):>6}  erro: {e}")
+                break
+            first = f"{first_sentence_latency(text):>14.3f}" if provider == 'local' else f"{'-':>14}"
+            print(f"{provider:<8}{len(text):>6}{statistics.median(runs):>13.3f}{first}")
+
+
+if __name__ == '__main__':
+    main()
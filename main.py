@@ -1,11 +1,14 @@
 import os
+import time
 from pathlib import Path
-from flask import Flask, request, jsonify, send_from_directory, url_for
+from flask import Flask, request, jsonify, send_from_directory, url_for, g, Response, stream_with_context
 from pyhocon import ConfigFactory
 from dotenv import load_dotenv
 from src.recorder import start_recording, stop_recording
-from src.transcriber import process_audio_with_llm, transcribe_audio
-from src.text_to_speech import text_to_speech_with_quality, get_tts_info
+from src.stt import transcribe_audio
+from src.transcriber import send_to_llm
+from src.text_to_speech import text_to_speech_with_quality, get_tts_info, resolve_provider, local_tts_available, stream_local_tts
+from src import metrics, scheduler
 # from googletrans import Translator  # Comentado temporariamente por conflito de dependências
 
 # 1) BASE_DIR agora é a pasta onde está o main.py (a raiz do projeto)
@@ -28,6 +31,19 @@ app = Flask(
 TEMP_DIR = BASE_DIR / 'temp'
 TEMP_DIR.mkdir(exist_ok=True)
 
+# Configurações de métricas/instrumentação
+METRICS_SERVER_TIMING = config.get('metrics.server_timing', True)
+PROFILING_ENABLED = config.get_bool('metrics.profiling.enabled', False)
+PROFILING_HEADER = config.get('metrics.profiling.header', 'X-Speakly-Profile')
+PROFILING_DIR = BASE_DIR / config.get('metrics.profiling.dir', 'temp/profiles')
+
+# Limites de concorrência e filas por etapa (STT, LLM, TTS)
+scheduler.configure(
+    {stage: config.get(f'scheduler.{stage}', {}) for stage in ('stt', 'llm', 'tts')},
+    max_wait=config.get('scheduler.max_wait', 30.0),
+    enabled=config.get('scheduler.enabled', True)
+)
+
 # Função para obter configurações de TTS
 def get_tts_config():
     return {
@@ -38,6 +54,70 @@ def get_tts_config():
         'gtts_slow': config.get('tts.gtts.slow', False)
     }
 
+# Instrumentação por requisição: tempos das etapas, Server-Timing e cProfile opcional
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    g.profiler = None
+    metrics.begin_request()
+    if PROFILING_ENABLED and request.headers.get(PROFILING_HEADER):
+        g.profiler = metrics.RequestProfiler(str(PROFILING_DIR))
+        g.profiler.start()
+
+@app.after_request
+def finish_request_metrics(response):
+    total = time.perf_counter() - g.get('request_start', time.perf_counter())
+    timings = metrics.end_request()
+    endpoint = request.endpoint or 'unknown'
+
+    metrics.observe('speakly_request_duration_seconds', total,
+                    help_text='Latência total das requisições HTTP', endpoint=endpoint)
+    metrics.inc('speakly_requests_total', help_text='Requisições HTTP atendidas',
+                endpoint=endpoint, status=response.status_code)
+
+    if g.get('profiler') is not None:
+        profile_path = g.profiler.stop(endpoint)
+        g.profiler = None
+        response.headers['X-Speakly-Profile-File'] = os.path.relpath(profile_path, BASE_DIR)
+
+    if METRICS_SERVER_TIMING:
+        timings.append(('total', total))
+        response.headers['Server-Timing'] = metrics.format_server_timing(timings)
+    return response
+
+# after_request não roda quando a view levanta exceção: garante que o cProfile
+# não continue ligado na thread do worker
+@app.teardown_request
+def stop_request_profiler(exc):
+    if g.get('profiler') is not None:
+        g.profiler.stop(f"{request.endpoint or 'unknown'}_error")
+        g.profiler = None
+
+# Etapa saturada: resposta rápida com Retry-After em vez de enfileirar sem limite
+@app.errorhandler(scheduler.Overloaded)
+def handle_overloaded(e):
+    response = jsonify({'error': str(e), 'stage': e.stage_name, 'retry_after': e.retry_after})
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+# Estado das filas do scheduler (para dimensionar a implantação)
+@app.route('/api/scheduler')
+def api_scheduler():
+    return jsonify(scheduler.status())
+
+# Estatísticas do hedging de STT (taxa de hedge, vitórias e circuitos)
+@app.route('/api/stt_hedging')
+def api_stt_hedging():
+    from src.stt import get_stt_hedging_stats
+    stats = get_stt_hedging_stats()
+    return jsonify(stats if stats is not None else {'enabled': False})
+
+# Endpoint de métricas no formato de exposição do Prometheus
+@app.route('/api/metrics')
+def api_metrics():
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 # Rota principal
 @app.route('/')
 def index():
@@ -52,47 +132,89 @@ def api_tts_info():
     return jsonify({
         'providers': tts_info,
         'current_config': tts_config,
-        'active_provider': 'openai' if tts_info['openai']['available'] and tts_config['provider'] in ['auto', 'openai'] else 'gtts'
+        'active_provider': resolve_provider(tts_config['provider'])
     })
 
+# Áudio do TTS local transmitido frase a frase (audio/wav)
+@app.route('/api/tts_stream', methods=['POST'])
+def api_tts_stream():
+    data = request.get_json(silent=True) or {}
+    text = data.get('text', '')
+
+    if not text:
+        return jsonify({'error': 'Texto não fornecido'}), 400
+    if not local_tts_available():
+        return jsonify({'error': 'TTS local não está disponível'}), 503
+
+    # Ocupa a vaga antes de responder, para que a sobrecarga ainda vire 429/503
+    # em vez de um stream interrompido. A vaga é devolvida quando a síntese
+    # termina, não quando um cliente lento acaba de receber o áudio.
+    release_slot = scheduler.acquire('tts')
+    try:
+        audio = stream_local_tts(text, on_synthesized=release_slot)
+    except Exception:
+        release_slot()
+        raise
+
+    # Espera a primeira frase dentro da requisição: esse tempo entra no Server-Timing
+    with metrics.stage('tts_first_sentence'):
+        first_chunks = [next(audio), next(audio, b'')]
+
+    def chunks():
+        yield from first_chunks
+        yield from audio
+
+    return Response(stream_with_context(chunks()), mimetype='audio/wav')
+
 # Endpoint que recebe o áudio gravado do front
 @app.route('/api/stop_recording', methods=['POST'])
 def api_stop_recording():
     f = request.files.get('file')
     user_level = request.form.get('user_level', 'begginer')  # Recebe o nível enviado
+    theme = request.form.get('theme')  # Tema da conversa (restringe a recuperação)
 
     if not f:
         return jsonify({'error': 'nenhum arquivo enviado'}), 400
 
+    # Recusa cedo se alguma etapa já estiver saturada
+    scheduler.admit('stt', 'llm', 'tts')
+
     temp_path = TEMP_DIR / f.filename
-    f.save(temp_path)
+    with metrics.stage('upload_save'):
+        f.save(temp_path)
+    upload_size = temp_path.stat().st_size
+    metrics.count_bytes('upload', upload_size)
+    priority = scheduler.recording_priority(upload_size)
 
     try:
-        # Chama apenas process_audio_with_llm que já faz a transcrição
-        result = process_audio_with_llm(str(temp_path),  user_level=user_level)
-
-        # Extrai os resultados
-        transcription = result['transcription']
-        llm_response = result['llm_response']
+        # Cada etapa ocupa uma vaga do seu limitador (clipes curtos têm prioridade)
+        with scheduler.slot('stt', priority):
+            transcription = transcribe_audio(str(temp_path))
+        with scheduler.slot('llm', priority):
+            llm_response = send_to_llm(transcription, user_level, theme)
 
         # Gera o áudio da resposta usando configuração atual
         tts_config = get_tts_config()
         # Como a resposta do LLM é em chinês, usar chinês para TTS
-        tts_filename = text_to_speech_with_quality(
-            llm_response, 
-            provider=tts_config['provider'],
-            quality=tts_config['quality'],
-            lang='zh-cn'  # Chinês simplificado para as respostas
-        )
+        with scheduler.slot('tts', priority):
+            tts_filename = text_to_speech_with_quality(
+                llm_response, 
+                provider=tts_config['provider'],
+                quality=tts_config['quality'],
+                lang='zh-cn'  # Chinês simplificado para as respostas
+            )
         audio_url = url_for('serve_tts', filename=tts_filename, _external=False)
 
         return jsonify({
             'level': user_level,
+            'theme': theme,
             'transcription': transcription,
             'llm_response': llm_response,
             'audio_url': audio_url
         }), 200
 
+    except scheduler.Overloaded:
+        raise
     except Exception as e:
         import traceback; traceback.print_exc()
         return jsonify({'error': str(e)}), 500
@@ -115,7 +237,8 @@ def api_translate():
         # Importar função de tradução do transcriber que já tem OpenAI configurado
         try:
             from src.transcriber import translate_text_with_llm
-            translated_text = translate_text_with_llm(text)
+            with scheduler.slot('llm', scheduler.TRANSLATE_PRIORITY):
+                translated_text = translate_text_with_llm(text)
             
             return jsonify({
                 'original_text': text,
@@ -131,6 +254,8 @@ def api_translate():
                 'detected_language': 'zh'
             }), 200
         
+    except scheduler.Overloaded:
+        raise
     except Exception as e:
         print(f"Erro na tradução: {e}")
         return jsonify({'error': f'Erro ao traduzir: {str(e)}'}), 500
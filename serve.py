@@ -0,0 +1,101 @@
+"""
+Servidor de produção do Speakly (gunicorn, worker gthread).
+
+O processo mestre importa a aplicação, carrega o modelo Whisper e mapeia o
+índice FAISS antes do fork; os workers herdam essas páginas copy-on-write em
+vez de cada um carregar sua própria cópia.
+
+O histórico das conversas fica na memória do processo (MemorySaver), então o
+padrão é 1 worker com várias threads: com mais workers cada turno pode ir para
+um worker com outro histórico e /api/clear_memory só limpa um deles. Reiniciar
+ou reciclar o worker também apaga o histórico.
+
+Uso:
+    python serve.py                      # usa a seção server do speakly.conf
+    SPEAKLY_WORKERS=4 python serve.py
+
+Sinais (enviados ao processo mestre):
+    HUP   reinicia os workers graciosamente (código e modelos pré-carregados são mantidos)
+    TERM  encerra aguardando as requisições em andamento (graceful_timeout)
+    USR2  inicia um novo mestre com o código atualizado; depois envie TERM ao antigo
+"""
+import gc
+import os
+from pathlib import Path
+from pyhocon import ConfigFactory
+from gunicorn.app.base import BaseApplication
+
+BASE_DIR = Path(__file__).parent.resolve()
+config = ConfigFactory.parse_file(str(BASE_DIR / 'speakly.conf'))
+
+TORCH_THREADS = config.get('server.torch_threads', 1)
+
+# Precisa ser definido antes de importar torch para limitar o pool de threads do OpenMP
+os.environ.setdefault('OMP_NUM_THREADS', str(TORCH_THREADS))
+os.environ.setdefault('MKL_NUM_THREADS', str(TORCH_THREADS))
+
+
+def preload_shared_models():
+    """
+    Carrega no mestre tudo que é somente-leitura e caro de inicializar:
+    grafo LangGraph, índice vetorial (mmap) e, se configurado, o Whisper local
+    """
+    os.chdir(BASE_DIR)  # transcriber lê speakly.conf e o índice com caminhos relativos
+    from main import app
+    from src import stt, transcriber
+
+    if config.get('server.preload_whisper', True):
+        stt.get_whisper_model()
+    stt.get_stt_hedger()
+    transcriber.get_or_create_global_graph()
+
+    # Move os objetos já criados para a geração permanente do GC, evitando que
+    # as coletas nos workers toquem (e copiem) as páginas herdadas do mestre
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def post_fork(server, worker):
+    try:
+        import torch
+        torch.set_num_threads(TORCH_THREADS)
+    except ImportError:
+        pass
+
+
+class SpeaklyApplication(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return preload_shared_models()
+
+
+def gunicorn_options():
+    return {
+        'bind': f"{config.get('server.host', '127.0.0.1')}:{config.get('server.port', 5000)}",
+        'workers': int(config.get('server.workers', 1)),
+        'threads': int(config.get('server.threads', 8)),
+        'worker_class': 'gthread',
+        'timeout': int(config.get('server.timeout', 120)),
+        'graceful_timeout': int(config.get('server.graceful_timeout', 30)),
+        'max_requests': int(config.get('server.max_requests', 0)),
+        'max_requests_jitter': int(config.get('server.max_requests_jitter', 100)),
+        'preload_app': True,
+        'post_fork': post_fork,
+        'accesslog': '-',
+    }
+
+
+if __name__ == '__main__':
+    options = gunicorn_options()
+    if options['workers'] > 1:
+        print(f"Aviso: {options['workers']} workers com histórico de conversa em memória; "
+              "turnos de uma mesma sessão podem perder o contexto ao trocar de worker")
+    SpeaklyApplication(options).run()
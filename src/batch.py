@@ -0,0 +1,270 @@
+"""
+Processamento offline em lote, sem passar pelos endpoints web.
+
+Transcrição de uma pasta de áudios (QA de gravações de alunos):
+    python -m src.batch transcribe gravacoes/ --workers 4
+
+Pré-geração do cache de TTS a partir de uma lista de frases (.txt ou .csv):
+    python -m src.batch tts vocabulario_hsk1.csv --column hanzi --lang zh-cn
+    python -m src.batch tts vocabulario_hsk1.csv --provider local   # offline (Piper)
+
+Saídas já existentes são puladas, então basta rodar o mesmo comando de novo
+para retomar após uma interrupção. Cada execução atualiza um manifest JSON com
+o status e o tempo de cada item.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+AUDIO_EXTENSIONS = {'.wav', '.mp3', '.webm', '.m4a', '.ogg', '.flac'}
+
+
+class Manifest:
+    """
+    Registro persistente do lote: um item por entrada, gravado de forma atômica
+    a cada resultado para que uma interrupção não perca o progresso.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.items = {}
+        if self.path.exists():
+            with open(self.path, encoding='utf-8') as f:
+                self.items = json.load(f).get('items', {})
+
+    def record(self, key, entry):
+        self.items[key] = entry
+        self.save()
+
+    def save(self, summary=None):
+        data = {'items': self.items}
+        if summary:
+            data['summary'] = summary
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def run_pool(executor, jobs, manifest, describe):
+    """
+    Executa `jobs` (chave -> (func, args)) no pool, gravando cada resultado no manifest.
+    Em Ctrl+C cancela o que ainda não começou e mantém o que já terminou.
+    """
+    start = time.perf_counter()
+    futures = {executor.submit(func, *args): key for key, (func, args) in jobs.items()}
+    try:
+        for done, future in enumerate(as_completed(futures), 1):
+            key = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                entry = {'status': 'error', 'error': str(e)}
+            manifest.record(key, entry)
+            print(f"[{done}/{len(futures)}] {entry['status']:<6} {describe(key)} ({entry.get('seconds', 0):.2f}s)")
+    except KeyboardInterrupt:
+        print("\nInterrompido: cancelando itens pendentes (rode novamente para retomar)")
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    return time.perf_counter() - start
+
+
+def summarize(manifest, wall_seconds, skipped):
+    statuses = [item['status'] for item in manifest.items.values()]
+    seconds = [item.get('seconds', 0) for item in manifest.items.values() if item['status'] == 'ok']
+    return {
+        'total': len(statuses),
+        'ok': statuses.count('ok'),
+        'cached': skipped,
+        'errors': statuses.count('error'),
+        'wall_seconds': round(wall_seconds, 3),
+        'work_seconds': round(sum(seconds), 3),
+    }
+
+
+# --- Transcrição ---
+
+def _init_transcriber(provider):
+    """Inicializador dos workers: importa o STT e já carrega o Whisper local"""
+    # src.stt não depende do LLM nem da base vetorial (sem credenciais para o Whisper local)
+    from src import stt
+    if provider == 'whisper':
+        stt.get_whisper_model()
+
+
+def transcribe_file(audio_path, output_path, provider):
+    from src import stt
+    transcribe = {
+        'openai': stt.transcribe_with_openai,
+        'whisper': stt.transcribe_with_whisper_local,
+    }.get(provider, stt.transcribe_audio)
+
+    start = time.perf_counter()
+    text = transcribe(str(audio_path))
+    seconds = time.perf_counter() - start
+
+    tmp_path = output_path.with_suffix('.txt.tmp')
+    tmp_path.write_text(text, encoding='utf-8')
+    os.replace(tmp_path, output_path)
+    return {'status': 'ok', 'output': str(output_path), 'seconds': round(seconds, 3), 'chars': len(text)}
+
+
+def run_transcribe(args):
+    input_dir = Path(args.input)
+    output_dir = Path(args.output or input_dir / 'transcripts')
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(args.manifest or output_dir / 'manifest.json')
+
+    provider = args.provider
+    if provider == 'config':
+        from pyhocon import ConfigFactory
+        provider = ConfigFactory.parse_file('speakly.conf').get('stt.provider', 'openai')
+
+    pattern = '**/*' if args.recursive else '*'
+    audio_files = sorted(p for p in input_dir.glob(pattern) if p.suffix.lower() in AUDIO_EXTENSIONS)
+
+    jobs, skipped = {}, 0
+    for audio_path in audio_files:
+        relative = audio_path.relative_to(input_dir)
+        output_path = output_dir / relative.with_suffix('.txt')
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        if output_path.exists() and not args.force:
+            skipped += 1
+            manifest.items.setdefault(str(relative), {'status': 'ok', 'output': str(output_path), 'seconds': 0})
+            continue
+        jobs[str(relative)] = (transcribe_file, (audio_path, output_path, provider))
+
+    print(f"{len(audio_files)} áudios encontrados, {skipped} já transcritos, {len(jobs)} a processar ({provider})")
+
+    # Whisper local é CPU-bound: um processo por worker. Providers de rede: threads.
+    if provider == 'whisper':
+        workers = args.workers or max(1, (os.cpu_count() or 2) // 2)
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_transcriber, initargs=(provider,))
+    else:
+        workers = args.workers or 4
+        _init_transcriber(provider)
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+    with executor:
+        wall_seconds = run_pool(executor, jobs, manifest, str)
+    manifest.save(summarize(manifest, wall_seconds, skipped))
+    print(f"Manifest salvo em {manifest.path}")
+
+
+# --- Pré-geração do cache de TTS ---
+
+def read_phrases(path, column=None):
+    """Lê frases de um .txt (uma por linha, '#' comenta) ou de uma coluna de um .csv"""
+    path = Path(path)
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if path.suffix.lower() != '.csv':
+            lines = (line.strip() for line in f)
+            return [line for line in lines if line and not line.startswith('#')]
+
+        reader = csv.reader(f)
+        header = next(reader, [])
+        if column is None:
+            index = header.index('text') if 'text' in header else 0
+        elif column in header:
+            index = header.index(column)
+        else:
+            raise SystemExit(f"Coluna '{column}' não encontrada no CSV (colunas: {', '.join(header)})")
+        return [row[index].strip() for row in reader if len(row) > index and row[index].strip()]
+
+
+def _init_tts(provider):
+    """Inicializador dos workers do TTS local: carrega a voz uma vez por processo"""
+    from dotenv import load_dotenv
+    load_dotenv()
+    from src import text_to_speech
+    if provider == 'local':
+        text_to_speech.get_local_voice()
+
+
+def synthesize_phrase(text, provider, quality, lang):
+    from src.text_to_speech import text_to_speech_with_quality
+
+    start = time.perf_counter()
+    filename = text_to_speech_with_quality(text, provider=provider, quality=quality, lang=lang)
+    seconds = time.perf_counter() - start
+    if not filename:
+        return {'status': 'error', 'error': 'TTS não gerou áudio', 'seconds': round(seconds, 3)}
+    return {'status': 'ok', 'output': filename, 'seconds': round(seconds, 3)}
+
+
+def run_tts(args):
+    from dotenv import load_dotenv
+    load_dotenv()
+    from src.text_to_speech import get_cached_tts, resolve_provider
+
+    phrases = list(dict.fromkeys(read_phrases(args.input, args.column)))
+    manifest = Manifest(args.manifest or Path(args.input).with_suffix('.manifest.json'))
+
+    jobs, skipped = {}, 0
+    for text in phrases:
+        cached = None if args.force else get_cached_tts(text, args.provider, args.quality, args.lang)
+        if cached:
+            skipped += 1
+            manifest.items[text] = {'status': 'ok', 'output': cached, 'seconds': 0}
+            continue
+        jobs[text] = (synthesize_phrase, (text, args.provider, args.quality, args.lang))
+
+    provider = resolve_provider(args.provider)
+    print(f"{len(phrases)} frases, {skipped} já em cache, {len(jobs)} a gerar ({provider})")
+
+    # TTS local é CPU-bound: um processo por worker. Providers de rede: threads.
+    if provider == 'local':
+        workers = args.workers or max(1, (os.cpu_count() or 2) // 2)
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_tts, initargs=(provider,))
+    else:
+        executor = ThreadPoolExecutor(max_workers=args.workers or 4)
+
+    with executor:
+        wall_seconds = run_pool(executor, jobs, manifest, lambda text: text[:40])
+    manifest.save(summarize(manifest, wall_seconds, skipped))
+    print(f"Manifest salvo em {manifest.path}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Processamento em lote do Speakly (transcrição e TTS)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    transcribe = subparsers.add_parser('transcribe', help='Transcreve uma pasta de áudios')
+    transcribe.add_argument('input', help='Pasta com os áudios')
+    transcribe.add_argument('--output', help='Pasta das transcrições (padrão: <input>/transcripts)')
+    transcribe.add_argument('--provider', default='config', choices=['config', 'openai', 'whisper'],
+                            help="Backend de STT ('config' usa stt.provider do speakly.conf)")
+    transcribe.add_argument('--recursive', action='store_true', help='Inclui subpastas')
+    transcribe.set_defaults(func=run_transcribe)
+
+    tts = subparsers.add_parser('tts', help='Pré-gera o cache de TTS para uma lista de frases')
+    tts.add_argument('input', help='Arquivo .txt (uma frase por linha) ou .csv')
+    tts.add_argument('--column', help="Coluna do CSV com o texto (padrão: 'text' ou a primeira)")
+    tts.add_argument('--provider', default='auto', choices=['auto', 'openai', 'gtts', 'local'])
+    tts.add_argument('--quality', default='normal', choices=['fast', 'normal', 'high'])
+    tts.add_argument('--lang', default='zh-cn', help='Idioma para o gTTS (padrão: zh-cn)')
+    tts.set_defaults(func=run_tts)
+
+    for sub in (transcribe, tts):
+        sub.add_argument('--workers', type=int, default=None, help='Tamanho do pool de workers')
+        sub.add_argument('--manifest', help='Caminho do manifest JSON')
+        sub.add_argument('--force', action='store_true', help='Reprocessa mesmo se a saída já existir')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.func(args)
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+
+if __name__ == '__main__':
+    main()
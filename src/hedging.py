@@ -0,0 +1,248 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from src import metrics
+
+
+class CancelToken:
+    """Sinaliza a um backend que seu resultado não é mais necessário"""
+
+    def __init__(self):
+        self.cancelled = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def on_cancel(self, callback):
+        """Registra uma ação para interromper o trabalho (ex: fechar o cliente HTTP)"""
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Aviso: erro ao cancelar backend: {e}")
+
+
+class LatencyTracker:
+    """Janela das latências recentes de um backend para calcular o atraso do hedge"""
+
+    def __init__(self, percentile=95, min_delay=0.5, initial_delay=2.0, min_samples=20, window=200):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def hedge_delay(self):
+        """Percentil configurado das latências recentes (ou o atraso inicial, sem amostras suficientes)"""
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return self.initial_delay
+            ordered = sorted(self.samples)
+        rank = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(self.min_delay, ordered[rank])
+
+
+class CircuitBreaker:
+    """
+    Abre após `failure_threshold` falhas seguidas; enquanto aberto o backend é
+    evitado. Depois de `cooldown` segundos uma chamada de teste é permitida.
+    """
+
+    def __init__(self, failure_threshold=3, cooldown=30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            return 'half_open' if time.monotonic() - self.opened_at >= self.cooldown else 'open'
+
+    def allow(self):
+        return self.state != 'open'
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class HedgedCaller:
+    """
+    Chama o backend primário e, se ele não responder dentro do atraso de hedge,
+    dispara também o secundário; usa o primeiro resultado e cancela o outro.
+    Backends recebem (*args, token) e devem respeitar o CancelToken quando puderem.
+
+    `slots` (backend -> semáforo) limita quantas execuções de um backend rodam ao
+    mesmo tempo, inclusive as que continuam depois de perder o hedge. A chamada
+    normal espera uma vaga; o hedge só é disparado se houver vaga livre.
+    """
+
+    def __init__(self, name, primary, secondary, backends, percentile=95, min_delay=0.5,
+                 initial_delay=2.0, min_samples=20, failure_threshold=3, cooldown=30.0, max_workers=8,
+                 slots=None):
+        self.name = name
+        self.primary = primary
+        self.secondary = secondary
+        self.backends = backends
+        self.slots = slots or {}
+        self.trackers = {
+            backend: LatencyTracker(percentile, min_delay, initial_delay, min_samples)
+            for backend in backends
+        }
+        self.breakers = {backend: CircuitBreaker(failure_threshold, cooldown) for backend in backends}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"hedge-{name}")
+        self.counts = {'calls': 0, 'hedged': 0, 'hedge_won': 0, 'hedge_skipped': 0, 'fallback': 0, 'short_circuited': 0}
+        self.wins = {backend: 0 for backend in backends}
+        self._lock = threading.Lock()
+
+    def _count(self, key, backend=None):
+        with self._lock:
+            if backend is None:
+                self.counts[key] += 1
+            else:
+                self.wins[backend] += 1
+        labels = {'backend': backend} if backend else {}
+        metrics.inc(f'speakly_{self.name}_{key}_total', help_text=f'Chamadas de {self.name} ({key})', **labels)
+
+    def _acquire(self, backend, blocking=True):
+        """Reserva uma vaga do backend (sempre True se ele não tiver limite)"""
+        slot = self.slots.get(backend)
+        return slot is None or slot.acquire(blocking=blocking)
+
+    def _run(self, backend, token, args):
+        start = time.perf_counter()
+        try:
+            result = self.backends[backend](*args, token)
+        except Exception:
+            if token.cancelled:
+                # Perdedor interrompido: o tempo decorrido é um limite inferior da latência
+                # (e justamente a cauda lenta que o percentil precisa ver)
+                self.trackers[backend].record(time.perf_counter() - start)
+            else:
+                # Falhas rápidas não entram no percentil, só no circuito
+                self.breakers[backend].failure()
+            raise
+        finally:
+            # A vaga só volta quando a execução termina de fato, mesmo se já perdeu o hedge
+            if backend in self.slots:
+                self.slots[backend].release()
+        self.trackers[backend].record(time.perf_counter() - start)
+        if not token.cancelled:
+            self.breakers[backend].success()
+        return result
+
+    def _submit(self, backend, args):
+        """Dispara o backend no executor; a vaga dele (se houver) já deve estar reservada"""
+        token = CancelToken()
+        # Copia o contexto para que as etapas medidas no backend entrem no Server-Timing
+        context = contextvars.copy_context()
+        return self.executor.submit(context.run, self._run, backend, token, args), token
+
+    def _order(self):
+        """Primário e secundário, invertidos se o circuito do primário estiver aberto"""
+        if not self.breakers[self.primary].allow() and self.breakers[self.secondary].allow():
+            self._count('short_circuited')
+            return self.secondary, self.primary
+        return self.primary, self.secondary
+
+    def call(self, *args):
+        self._count('calls')
+        first, second = self._order()
+
+        self._acquire(first)
+        first_future, first_token = self._submit(first, args)
+        if not self.breakers[second].allow():
+            # Sem backend saudável para o hedge: segue só com o primeiro
+            return self._finish(first, first_future)
+
+        delay = self.trackers[first].hedge_delay()
+        done, _ = wait([first_future], timeout=delay)
+        if done:
+            return self._finish_or_fallback(first, second, first_future, args)
+
+        if not self._acquire(second, blocking=False):
+            # Sem vaga para o secundário: não dispara o hedge para não passar do limite
+            print(f"{self.name.upper()} {first} sem resposta em {delay:.2f}s, mas {second} está sem vaga; sem hedge")
+            self._count('hedge_skipped')
+            return self._finish_or_fallback(first, second, first_future, args)
+
+        print(f"{self.name.upper()} {first} sem resposta em {delay:.2f}s, disparando hedge com {second}")
+        self._count('hedged')
+        second_future, second_token = self._submit(second, args)
+        pending = {first_future: (first, second_token), second_future: (second, first_token)}
+        error = None
+        while pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                backend, other_token = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                other_token.cancel()
+                self._count('wins', backend)
+                if backend == second:
+                    self._count('hedge_won')
+                return result
+        raise error
+
+    def _finish_or_fallback(self, first, second, future, args):
+        try:
+            return self._finish(first, future)
+        except Exception as e:
+            print(f"Erro no {self.name.upper()} {first}: {e}. Fallback para {second}...")
+            self._count('fallback')
+            self._acquire(second)
+            fallback_future, _ = self._submit(second, args)
+            return self._finish(second, fallback_future)
+
+    def _finish(self, backend, future):
+        result = future.result()
+        self._count('wins', backend)
+        return result
+
+    def stats(self):
+        """Taxas de hedge e de vitória, atrasos atuais e estado dos circuitos"""
+        with self._lock:
+            counts = dict(self.counts)
+            wins = dict(self.wins)
+        hedged = counts['hedged']
+        return {
+            **counts,
+            'wins': wins,
+            'hedge_rate': hedged / counts['calls'] if counts['calls'] else 0.0,
+            # Fração dos hedges vencida pelo backend disparado depois do atraso
+            'hedge_win_rate': counts['hedge_won'] / hedged if hedged else 0.0,
+            'hedge_delay': {backend: round(t.hedge_delay(), 3) for backend, t in self.trackers.items()},
+            'breakers': {backend: b.state for backend, b in self.breakers.items()},
+        }
@@ -0,0 +1,185 @@
+import os
+import time
+import threading
+import contextvars
+import cProfile
+from contextlib import contextmanager
+
+# Buckets (em segundos) cobrindo desde uma busca no FAISS até uma chamada lenta ao provider
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+
+# Registro global: nome -> {'type', 'help', 'series': {labels_tuple: valor}}
+_metrics = {}
+
+# Tempos das etapas da requisição atual (usado para o header Server-Timing)
+_request_timings = contextvars.ContextVar("speakly_request_timings", default=None)
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _register(name, metric_type, help_text):
+    metric = _metrics.get(name)
+    if metric is None:
+        metric = {'type': metric_type, 'help': help_text, 'series': {}}
+        _metrics[name] = metric
+    return metric
+
+
+def inc(name, amount=1, help_text="", **labels):
+    """Incrementa um contador (ex: tokens, bytes, requisições)"""
+    with _lock:
+        series = _register(name, 'counter', help_text)['series']
+        key = _labels_key(labels)
+        series[key] = series.get(key, 0) + amount
+
+
+def set_gauge(name, value, help_text="", **labels):
+    """Define o valor atual de um gauge (ex: profundidade de fila)"""
+    with _lock:
+        series = _register(name, 'gauge', help_text)['series']
+        series[_labels_key(labels)] = value
+
+
+def observe(name, value, help_text="", buckets=DEFAULT_BUCKETS, **labels):
+    """Registra uma observação em um histograma"""
+    with _lock:
+        metric = _register(name, 'histogram', help_text)
+        metric.setdefault('buckets', buckets)
+        key = _labels_key(labels)
+        hist = metric['series'].get(key)
+        if hist is None:
+            hist = {'counts': [0] * len(metric['buckets']), 'sum': 0.0, 'count': 0}
+            metric['series'][key] = hist
+        for i, bound in enumerate(metric['buckets']):
+            if value <= bound:
+                hist['counts'][i] += 1
+        hist['sum'] += value
+        hist['count'] += 1
+
+
+def count_tokens(stage_name, prompt=0, completion=0, cached=0):
+    """Contabiliza os tokens consumidos por uma etapa que chama o LLM"""
+    for kind, amount in (('prompt', prompt), ('completion', completion), ('cached', cached)):
+        if amount:
+            inc('speakly_llm_tokens_total', amount,
+                help_text='Tokens consumidos por etapa do LLM', stage=stage_name, kind=kind)
+
+
+def count_bytes(stage_name, amount):
+    """Contabiliza os bytes processados por uma etapa (upload, áudio gerado, ...)"""
+    if amount:
+        inc('speakly_bytes_total', amount,
+            help_text='Bytes processados por etapa', stage=stage_name)
+
+
+def add_request_timing(name, seconds):
+    """Adiciona um tempo apenas ao Server-Timing da requisição atual"""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+def record_stage(stage_name, seconds):
+    """Registra a duração de uma etapa no histograma e no Server-Timing da requisição"""
+    observe('speakly_stage_duration_seconds', seconds,
+            help_text='Latência de cada etapa de um turno', stage=stage_name)
+    add_request_timing(stage_name, seconds)
+
+
+@contextmanager
+def stage(stage_name):
+    """Mede o tempo de um bloco de código como uma etapa do turno"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage_name, time.perf_counter() - start)
+
+
+def begin_request():
+    """Inicia a coleta de tempos para a requisição atual"""
+    _request_timings.set([])
+
+
+def end_request():
+    """Finaliza a coleta e retorna os tempos registrados na requisição"""
+    timings = _request_timings.get() or []
+    _request_timings.set(None)
+    return timings
+
+
+def format_server_timing(timings):
+    """
+    Formata os tempos no padrão do header Server-Timing
+    (https://www.w3.org/TR/server-timing/). Etapas repetidas são somadas.
+    """
+    totals = {}
+    for stage_name, seconds in timings:
+        totals[stage_name] = totals.get(stage_name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (f'{k}="{_escape_label(v)}"' for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_prometheus():
+    """Gera o texto das métricas no formato de exposição do Prometheus"""
+    lines = []
+    with _lock:
+        for name in sorted(_metrics):
+            metric = _metrics[name]
+            if metric['help']:
+                lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for key, value in metric['series'].items():
+                if metric['type'] != 'histogram':
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+                    continue
+                for bound, count in zip(metric['buckets'], value['counts']):
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {value['count']}")
+                lines.append(f"{name}_sum{_format_labels(key)} {value['sum']}")
+                lines.append(f"{name}_count{_format_labels(key)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """Limpa todas as métricas registradas"""
+    with _lock:
+        _metrics.clear()
+
+
+class RequestProfiler:
+    """
+    Captura opcional de cProfile para uma única requisição.
+    O resultado é salvo como arquivo .prof (abrir com snakeviz ou pstats).
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.profiler = cProfile.Profile()
+        self.path = None
+
+    def start(self):
+        self.profiler.enable()
+
+    def stop(self, label="request"):
+        self.profiler.disable()
+        os.makedirs(self.output_dir, exist_ok=True)
+        safe_label = "".join(c if c.isalnum() else "_" for c in label).strip("_") or "request"
+        self.path = os.path.join(self.output_dir, f"{safe_label}_{int(time.time() * 1000)}.prof")
+        self.profiler.dump_stats(self.path)
+        return self.path
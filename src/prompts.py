@@ -0,0 +1,108 @@
+import re
+import tiktoken
+from langchain_core.messages import SystemMessage
+
+# Instruções fixas do assistente. Ficam no início do prompt e nunca mudam entre
+# turnos, formando um prefixo estável que o cache de prompt do provider reaproveita.
+STATIC_SYSTEM_PROMPT = (
+    "You are a Chinese language learning assistant specialized in helping learners practice conversation. "
+    "CRITICAL: You MUST always respond ONLY in Simplified Chinese (简体中文). Never use English or any other language in your responses. "
+    "You are knowledgeable about all topics and can discuss anything the user wants to talk about freely. "
+    "Use the retrieved reference content provided at the end of the conversation to help answer, but feel free to expand beyond it with your general knowledge. "
+    "Keep responses engaging, educational, and conversational. Use 1-3 sentences maximum. "
+    "IMPORTANT: Always respond in a way that continues the conversation naturally. "
+    "Ask follow-up questions or make statements that invite more conversation. "
+    "Never end with polite closings like '如果你需要帮助，请告诉我' or '有什么问题吗？' "
+    "Instead, respond naturally and keep the conversation flowing. "
+    "Strictly follow the user's language level requirements:\n"
+)
+
+# Instrução de nível com ênfase em chinês simplificado (instruções em inglês)
+LEVEL_INSTRUCTIONS = {
+    "begginer": "You MUST respond ONLY in Simplified Chinese (简体中文). Use only HSK1 level vocabulary and grammar. Ensure all characters are in Simplified Chinese, never use Traditional Chinese characters.",
+    "intermediate": "You MUST respond ONLY in Simplified Chinese (简体中文). Use HSK1 and HSK2 level vocabulary and grammar. Ensure all characters are in Simplified Chinese, never use Traditional Chinese characters.",
+    "advanced": "You MUST respond ONLY in Simplified Chinese (简体中文). You can use A1 to C2 level vocabulary and grammar. Ensure all characters are in Simplified Chinese, never use Traditional Chinese characters.",
+}
+DEFAULT_LEVEL_INSTRUCTION = "You MUST respond ONLY in Simplified Chinese (简体中文). Ensure all characters are in Simplified Chinese, never use Traditional Chinese characters."
+
+# Mensagens de sistema prontas por nível, montadas uma única vez na importação
+_LEVEL_SYSTEM_MESSAGES = {
+    level: SystemMessage(STATIC_SYSTEM_PROMPT + instruction)
+    for level, instruction in LEVEL_INSTRUCTIONS.items()
+}
+_DEFAULT_SYSTEM_MESSAGE = SystemMessage(STATIC_SYSTEM_PROMPT + DEFAULT_LEVEL_INSTRUCTION)
+
+_encoding_cache = {}
+
+# Um "token" estimado: um caractere CJK ou até 4 caracteres de outros alfabetos
+_ESTIMATED_TOKEN = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]|[^\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]{1,4}")
+
+
+class CharEstimateEncoding:
+    """
+    Estimativa de tokens por caracteres, usada quando o arquivo do tiktoken não
+    está disponível (ex: sem rede). Conta para mais em textos em inglês, nunca
+    deixa o contexto passar do orçamento por causa do tokenizer.
+    """
+
+    name = "char_estimate"
+
+    def encode(self, text):
+        return _ESTIMATED_TOKEN.findall(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+def level_system_message(user_level):
+    """Prefixo fixo do prompt para o nível do usuário"""
+    return _LEVEL_SYSTEM_MESSAGES.get(user_level, _DEFAULT_SYSTEM_MESSAGE)
+
+
+def get_encoding(model_name):
+    """
+    Tokenizer local (tiktoken) do modelo, com fallback para o o200k_base. Na
+    primeira vez o tiktoken baixa o arquivo do encoding (ou lê de TIKTOKEN_CACHE_DIR);
+    se falhar, usa a estimativa por caracteres em vez de derrubar o turno.
+    """
+    encoding = _encoding_cache.get(model_name)
+    if encoding is None:
+        try:
+            try:
+                encoding = tiktoken.encoding_for_model(model_name)
+            except KeyError:
+                encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            print(f"Aviso: tokenizer do tiktoken indisponível para {model_name} ({e}); "
+                  "usando estimativa por caracteres. Defina TIKTOKEN_CACHE_DIR com o arquivo do encoding.")
+            encoding = CharEstimateEncoding()
+        _encoding_cache[model_name] = encoding
+    return encoding
+
+
+def trim_to_token_budget(chunks, budget, model_name):
+    """
+    Junta os trechos recuperados (na ordem de relevância) até `budget` tokens.
+    O último trecho que não cabe inteiro é cortado; os seguintes são descartados.
+    """
+    encoding = get_encoding(model_name)
+    separator_tokens = len(encoding.encode("\n\n"))
+    kept, used = [], 0
+    for chunk in chunks:
+        tokens = encoding.encode(chunk)
+        separator = separator_tokens if kept else 0
+        if used + separator + len(tokens) <= budget:
+            kept.append(chunk)
+            used += separator + len(tokens)
+            continue
+        remaining = budget - used - separator
+        if remaining > 0:
+            kept.append(encoding.decode(tokens[:remaining]))
+            used += separator + remaining
+        break
+    return "\n\n".join(kept), used
+
+
+def reference_message(docs_content):
+    """Parte variável do prompt: contexto recuperado, sempre depois do histórico"""
+    return SystemMessage(f"Reference Content:\n{docs_content}")
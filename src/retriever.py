@@ -1,15 +1,35 @@
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
+from src.metrics import stage
+from src.vector_db import normalize_theme
 
 class Retriever:
-    def __init__(self, vector_db):
+    def __init__(self, vector_db, k=2, fetch_k=20, lambda_mult=0.5, general_theme="conversacao-geral"):
         self.vector_db = vector_db
+        self.k = k
+        # Candidatos buscados no FAISS antes do re-ranqueamento por MMR
+        self.fetch_k = fetch_k
+        # 1.0 = só relevância, 0.0 = só diversidade
+        self.lambda_mult = lambda_mult
+        # Tema que significa "sem filtro" (busca no índice inteiro)
+        self.general_theme = normalize_theme(general_theme)
+        # Ferramenta criada a partir do método já ligado à instância (sem `self` no schema)
+        self.retrieve = tool("retrieve", response_format="content_and_artifact")(self._retrieve)
 
-    @tool(response_format="content_and_artifact")
-    def retrieve(self, query: str):
+    def theme_for(self, config):
+        """Tema da sessão, vindo de config['configurable']['theme'] na chamada do grafo"""
+        theme = normalize_theme((config or {}).get("configurable", {}).get("theme"))
+        return None if not theme or theme == self.general_theme else theme
+
+    def _retrieve(self, query: str, config: RunnableConfig):
         """Retrieve information related to a query."""
-        retrieved_docs = self.vector_db.similarity_search(query, k=2)
+        theme = self.theme_for(config)
+        with stage("retrieval"):
+            retrieved_docs = self.vector_db.max_marginal_relevance_search(
+                query, k=self.k, fetch_k=self.fetch_k, lambda_mult=self.lambda_mult, theme=theme
+            )
         serialized = "\n\n".join(
             (f"Source: {doc.metadata}\n" f"Content: {doc.page_content}")
             for doc in retrieved_docs
         )
-        return serialized, retrieved_docs
\ No newline at end of file
+        return serialized, retrieved_docs
@@ -0,0 +1,197 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from src import metrics
+
+# Prioridades (menor = atendido primeiro): tradução é curta e interativa,
+# gravações são ordenadas pelo tamanho do clipe
+TRANSLATE_PRIORITY = (0, 0)
+
+
+def recording_priority(size_bytes):
+    """Prioridade de uma gravação: clipes curtos passam na frente dos longos"""
+    return (1, size_bytes)
+
+
+class Overloaded(Exception):
+    """
+    A etapa está saturada. `status` é 429 quando a fila já está cheia na admissão
+    e 503 quando a requisição esperou `max_wait` sem conseguir vaga.
+    """
+
+    def __init__(self, stage_name, retry_after, status=503):
+        super().__init__(f"Etapa '{stage_name}' sobrecarregada, tente novamente em {retry_after}s")
+        self.stage_name = stage_name
+        self.retry_after = retry_after
+        self.status = status
+
+
+class StageLimiter:
+    """
+    Limita a concorrência de uma etapa (STT, LLM, TTS) com uma fila limitada
+    e ordenada por prioridade. Quem espera mais que `max_wait` é recusado.
+    """
+
+    def __init__(self, name, concurrency, max_queue, max_wait):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = []  # heap de [prioridade, sequência]
+        self._seq = itertools.count()
+        self._service_time = 1.0  # média móvel (EWMA) do tempo de uso de uma vaga
+
+    def retry_after(self):
+        """Estimativa (s) de quando a fila atual terá sido drenada"""
+        backlog = len(self._waiting) + 1
+        return max(1, math.ceil(self._service_time * backlog / self.concurrency))
+
+    def has_room(self):
+        with self._cond:
+            return self._active < self.concurrency or len(self._waiting) < self.max_queue
+
+    def _publish(self):
+        metrics.set_gauge('speakly_queue_depth', len(self._waiting),
+                          help_text='Requisições aguardando vaga por etapa', stage=self.name)
+        metrics.set_gauge('speakly_stage_active', self._active,
+                          help_text='Requisições em execução por etapa', stage=self.name)
+
+    def _reject(self, reason, status):
+        metrics.inc('speakly_rejected_total', help_text='Requisições recusadas pelo controle de admissão',
+                    stage=self.name, reason=reason)
+        raise Overloaded(self.name, self.retry_after(), status)
+
+    def acquire(self, priority=(1, 0)):
+        start = time.perf_counter()
+        with self._cond:
+            if self._active >= self.concurrency or self._waiting:
+                if len(self._waiting) >= self.max_queue:
+                    self._reject('queue_full', 429)
+                entry = [priority, next(self._seq)]
+                heapq.heappush(self._waiting, entry)
+                self._publish()
+                deadline = start + self.max_wait
+                while not (self._waiting[0] is entry and self._active < self.concurrency):
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        self._waiting.remove(entry)
+                        heapq.heapify(self._waiting)
+                        self._publish()
+                        self._cond.notify_all()
+                        self._reject('timeout', 503)
+                    self._cond.wait(remaining)
+                heapq.heappop(self._waiting)
+            self._active += 1
+            self._publish()
+            # Acorda o próximo da fila caso ainda haja vagas livres
+            self._cond.notify_all()
+
+        wait = time.perf_counter() - start
+        metrics.observe('speakly_queue_wait_seconds', wait,
+                        help_text='Tempo de espera na fila por etapa', stage=self.name)
+        metrics.add_request_timing(f"queue_{self.name}", wait)
+
+    def release(self, held_seconds=None):
+        with self._cond:
+            self._active -= 1
+            if held_seconds is not None:
+                self._service_time = 0.8 * self._service_time + 0.2 * held_seconds
+            self._publish()
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority=(1, 0)):
+        self.acquire(priority)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+
+_limiters = {}
+_enabled = True
+
+
+def configure(stages, max_wait=30.0, enabled=True):
+    """
+    Configura os limitadores. `stages` mapeia nome -> {'concurrency', 'queue'}.
+    """
+    global _enabled
+    _enabled = enabled
+    _limiters.clear()
+    for name, options in stages.items():
+        _limiters[name] = StageLimiter(
+            name,
+            concurrency=int(options.get('concurrency', 4)),
+            max_queue=int(options.get('queue', 16)),
+            max_wait=float(options.get('max_wait', max_wait)),
+        )
+
+
+def admit(*stage_names):
+    """
+    Controle de admissão: recusa de imediato (429) se alguma das etapas que a
+    requisição vai usar já estiver com a fila cheia, antes de gastar trabalho.
+    """
+    if not _enabled:
+        return
+    for name in stage_names:
+        limiter = _limiters.get(name)
+        if limiter is not None and not limiter.has_room():
+            with limiter._cond:
+                limiter._reject('queue_full', 429)
+
+
+@contextmanager
+def slot(stage_name, priority=(1, 0)):
+    """Ocupa uma vaga da etapa (ou nada faz se o scheduler estiver desligado)"""
+    limiter = _limiters.get(stage_name) if _enabled else None
+    if limiter is None:
+        yield
+        return
+    with limiter.slot(priority):
+        yield
+
+
+def acquire(stage_name, priority=(1, 0)):
+    """
+    Ocupa uma vaga da etapa e devolve a função que a libera, para quando a vaga
+    não cabe em um bloco `with` (ex: liberada por outra thread). Chamar a função
+    mais de uma vez não tem efeito.
+    """
+    limiter = _limiters.get(stage_name) if _enabled else None
+    if limiter is None:
+        return lambda: None
+    limiter.acquire(priority)
+    start = time.perf_counter()
+    lock = threading.Lock()
+    held = [True]
+
+    def release():
+        with lock:
+            if not held[0]:
+                return
+            held[0] = False
+        limiter.release(time.perf_counter() - start)
+    return release
+
+
+def status():
+    """Estado atual das filas (para dimensionamento e debug)"""
+    result = {}
+    for name, limiter in _limiters.items():
+        with limiter._cond:
+            result[name] = {
+                'active': limiter._active,
+                'queued': len(limiter._waiting),
+                'concurrency': limiter.concurrency,
+                'max_queue': limiter.max_queue,
+                'avg_service_seconds': round(limiter._service_time, 3),
+            }
+    return result
@@ -0,0 +1,203 @@
+import os
+import threading
+from pathlib import Path
+import whisper
+from openai import OpenAI
+from pyhocon import ConfigFactory
+from dotenv import load_dotenv
+from src.metrics import stage
+from src.hedging import HedgedCaller
+
+# Speech-to-Text (API da OpenAI e Whisper local). Este módulo não cria clientes,
+# modelos nem índices na importação, então pode ser usado sem a pilha LLM/RAG
+# (ex: python -m src.batch transcribe).
+
+BASE_DIR = Path(__file__).parent.parent.resolve()
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+
+config = ConfigFactory.parse_file(str(BASE_DIR / 'speakly.conf'))
+
+# Configurações de STT (Speech-to-Text)
+STT_PROVIDER = config.get('stt.provider', 'openai')
+STT_OPENAI_MODEL = config.get('stt.openai.model', 'whisper-1')
+STT_LANGUAGE = config.get('stt.openai.language', 'en')
+STT_TEMPERATURE = config.get('stt.openai.temperature', 0.0)
+STT_PROMPT = config.get('stt.openai.prompt', 'This is an English conversation for language learning.')
+
+# Hedging de STT: dispara o backend secundário se o primário demorar demais
+STT_HEDGING = config.get('stt.hedging', {})
+STT_HEDGING_ENABLED = config.get_bool('stt.hedging.enabled', False)
+
+# Configurações do Whisper local (fallback)
+WHISPER_MODEL = config.get('whisper.model', 'base')
+WHISPER_LANGUAGE = config.get('whisper.language', 'en')  # Inglês
+WHISPER_FP16 = config.get('whisper.fp16', False)
+WHISPER_VERBOSE = config.get('whisper.verbose', False)
+
+# Cache do modelo Whisper para evitar recarregar
+_whisper_model_cache = None
+_whisper_model_lock = threading.Lock()
+
+# Limite de transcrições locais simultâneas (CPU), o mesmo da etapa stt do scheduler.
+# Vale também para execuções que continuam depois de perder um hedge.
+WHISPER_CONCURRENCY = int(config.get('scheduler.stt.concurrency', 4))
+_whisper_slots = threading.BoundedSemaphore(WHISPER_CONCURRENCY)
+
+# HedgedCaller criado na primeira transcrição (ou no pré-carregamento do servidor)
+_stt_hedger = None
+_stt_hedger_lock = threading.Lock()
+
+def get_whisper_model():
+    """Carrega o modelo Whisper uma única vez e mantém em cache"""
+    global _whisper_model_cache
+    if _whisper_model_cache is None:
+        with _whisper_model_lock:
+            if _whisper_model_cache is None:
+                print(f"Carregando modelo Whisper: {WHISPER_MODEL} (primeira vez)")
+                _whisper_model_cache = whisper.load_model(WHISPER_MODEL)
+    return _whisper_model_cache
+
+def transcribe_audio(audio_filename):
+    """
+    Transcreve áudio usando OpenAI STT API ou Whisper local como fallback
+    """
+    print(f"Transcrevendo arquivo: {audio_filename}")
+
+    with stage("stt"):
+        hedger = get_stt_hedger()
+        if hedger is not None:
+            return hedger.call(audio_filename)
+        if STT_PROVIDER == 'openai':
+            return transcribe_with_openai(audio_filename)
+        else:
+            return transcribe_with_whisper_local(audio_filename)
+
+def _openai_transcription(client, audio_filename):
+    """Chamada à API de transcrição da OpenAI, sem fallback (erros são propagados)"""
+    # Preparar parâmetros para a transcrição
+    transcript_params = {
+        "model": STT_OPENAI_MODEL,
+        "file": None,  # será definido abaixo
+        "temperature": STT_TEMPERATURE,
+        "prompt": STT_PROMPT
+    }
+
+    # Adicionar language apenas se não for null
+    if STT_LANGUAGE and STT_LANGUAGE.lower() != 'null':
+        transcript_params["language"] = STT_LANGUAGE
+
+    with stage("stt_openai"), open(audio_filename, "rb") as audio_file:
+        transcript_params["file"] = audio_file
+        transcript = client.audio.transcriptions.create(**transcript_params)
+
+    result_text = transcript.text.strip()
+    print(f"Transcrição OpenAI concluída: {result_text}")
+    return result_text
+
+def transcribe_with_openai(audio_filename):
+    """
+    Transcreve áudio usando a API da OpenAI (Whisper-1)
+    """
+    try:
+        client = OpenAI(api_key=OPENAI_API_KEY)
+        return _openai_transcription(client, audio_filename)
+
+    except Exception as e:
+        print(f"Erro na transcrição OpenAI: {e}")
+        print("Fallback para Whisper local...")
+        return transcribe_with_whisper_local(audio_filename)
+
+def transcribe_with_whisper_local(audio_filename):
+    """
+    Transcreve áudio usando Whisper local (fallback)
+    """
+    with _whisper_slots:
+        return _whisper_transcription(audio_filename)
+
+def _whisper_transcription(audio_filename):
+    """Inferência do Whisper local; quem chama já deve ter reservado uma vaga em _whisper_slots"""
+    print("Usando Whisper local...")
+
+    # Usa modelo em cache (muito mais rápido)
+    model = get_whisper_model()
+
+    # Configurações otimizadas para inglês
+    transcribe_options = {
+        "fp16": WHISPER_FP16,
+        "verbose": WHISPER_VERBOSE,
+        "temperature": 0.0,
+    }
+
+    # Adicionar idioma se especificado
+    if WHISPER_LANGUAGE != "auto":
+        transcribe_options["language"] = WHISPER_LANGUAGE
+
+    # Decodifica o áudio separadamente para medir o custo do ffmpeg
+    with stage("decode"):
+        audio = whisper.load_audio(audio_filename)
+
+    print(f"Iniciando transcrição local com modelo {WHISPER_MODEL}...")
+    with stage("stt_whisper"):
+        result = model.transcribe(audio, **transcribe_options)
+
+    transcript = result["text"].strip()
+    print(f"Transcrição local concluída: {transcript}")
+
+    return transcript
+
+# --- Hedging de STT entre a API da OpenAI e o Whisper local ---
+
+def _openai_stt_backend(audio_filename, token):
+    client = OpenAI(api_key=OPENAI_API_KEY, timeout=STT_HEDGING.get('request_timeout', 30.0))
+    # Fechar o cliente interrompe a requisição HTTP em andamento se o outro backend vencer
+    token.on_cancel(client.close)
+    return _openai_transcription(client, audio_filename)
+
+def _whisper_stt_backend(audio_filename, token):
+    # A inferência local não pode ser interrompida; só evita começar se já foi cancelada
+    if token.cancelled:
+        raise RuntimeError("Transcrição local cancelada antes de iniciar")
+    # A vaga em _whisper_slots é reservada e devolvida pelo HedgedCaller
+    return _whisper_transcription(audio_filename)
+
+def create_stt_hedger():
+    """
+    Cria o HedgedCaller do STT: o provider configurado é o primário e o outro
+    backend é disparado quando o primário passa do percentil de latência configurado
+    """
+    primary = 'openai' if STT_PROVIDER == 'openai' else 'whisper'
+    secondary = 'whisper' if primary == 'openai' else 'openai'
+    return HedgedCaller(
+        'stt',
+        primary,
+        secondary,
+        {'openai': _openai_stt_backend, 'whisper': _whisper_stt_backend},
+        percentile=STT_HEDGING.get('percentile', 95),
+        min_delay=STT_HEDGING.get('min_delay', 0.5),
+        initial_delay=STT_HEDGING.get('initial_delay', 2.0),
+        min_samples=STT_HEDGING.get('min_samples', 20),
+        failure_threshold=STT_HEDGING.get('breaker.failure_threshold', 3),
+        cooldown=STT_HEDGING.get('breaker.cooldown', 30.0),
+        slots={'whisper': _whisper_slots},
+    )
+
+def get_stt_hedger():
+    """HedgedCaller do STT (None se o hedging estiver desativado)"""
+    global _stt_hedger
+    if STT_HEDGING_ENABLED and _stt_hedger is None:
+        with _stt_hedger_lock:
+            if _stt_hedger is None:
+                # O Whisper local precisa estar carregado para competir com a API
+                get_whisper_model()
+                _stt_hedger = create_stt_hedger()
+    return _stt_hedger
+
+def get_stt_hedging_stats():
+    """Taxa de hedge, taxa de vitória e estado dos circuitos (None se desativado)"""
+    if not STT_HEDGING_ENABLED:
+        return None
+    return get_stt_hedger().stats()
@@ -1,14 +1,43 @@
 import os
-import time
 import re
+import queue
+import hashlib
+import struct
+import tempfile
+import threading
+import wave
+from contextlib import contextmanager
 from pathlib import Path
 from openai import OpenAI
 from gtts import gTTS
+from pyhocon import ConfigFactory
+from src.metrics import stage, count_bytes
 
 BASE_DIR = Path(__file__).parent.parent.resolve()
 TTS_DIR = BASE_DIR / 'public' / 'tts'
 TTS_DIR.mkdir(parents=True, exist_ok=True)
 
+config = ConfigFactory.parse_file(str(BASE_DIR / 'speakly.conf'))
+
+# Configurações do TTS local (Piper, offline na CPU)
+LOCAL_TTS_MODEL = BASE_DIR / config.get('tts.local.model', 'models/tts/zh_CN-huayan-medium.onnx')
+LOCAL_TTS_CONFIG = config.get('tts.local.config', None)
+LOCAL_TTS_SPEAKER = config.get('tts.local.speaker', None)
+LOCAL_TTS_PREFER_IN_AUTO = config.get_bool('tts.local.prefer_in_auto', False)
+
+# Piper é opcional: sem o pacote ou sem o modelo, o provider local fica indisponível
+try:
+    from piper import PiperVoice
+except ImportError:
+    PiperVoice = None
+
+# Voz local carregada uma única vez e mantida entre as chamadas
+_local_voice_cache = None
+_local_voice_lock = threading.Lock()
+
+# Fim de frase em chinês e em línguas ocidentais (a pontuação fica com a frase)
+SENTENCE_END = re.compile(r'(?<=[。！？；!?;])\s*|(?<=[.])\s+')
+
 # Inicializar cliente OpenAI (apenas se a chave estiver disponível)
 openai_client = None
 if os.getenv("OPENAI_API_KEY"):
@@ -65,6 +94,181 @@ def clean_text_for_tts(text):
     
     return text.strip()
 
+def tts_cache_filename(provider, clean_text, ext='mp3', **params):
+    """
+    Nome de arquivo determinístico para o áudio: o mesmo texto com os mesmos
+    parâmetros sempre gera o mesmo arquivo, que passa a funcionar como cache.
+    """
+    key = "|".join([provider] + [f"{k}={params[k]}" for k in sorted(params)] + [clean_text])
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+    return f"tts_{provider}_{digest}.{ext}"
+
+def resolve_provider(provider='auto'):
+    """
+    Provider que será usado de fato: em 'auto' prefere o local (se configurado e
+    disponível), depois OpenAI e por fim gTTS; providers indisponíveis caem para gTTS
+    """
+    if provider == 'auto':
+        if LOCAL_TTS_PREFER_IN_AUTO and local_tts_available():
+            return 'local'
+        return 'openai' if openai_client else 'gtts'
+    if provider == 'openai' and not openai_client:
+        return 'gtts'
+    if provider == 'local' and not local_tts_available():
+        return 'openai' if openai_client else 'gtts'
+    return provider
+
+def _cached(filename):
+    """Retorna o nome do arquivo se o áudio já existir no cache"""
+    out_path = TTS_DIR / filename
+    if out_path.exists() and out_path.stat().st_size > 0:
+        return filename
+    return None
+
+@contextmanager
+def _atomic_output(filename):
+    """
+    Caminho temporário único para escrever o áudio; ao terminar sem erro ele é
+    movido para `filename`. Assim um áudio truncado nunca entra no cache e duas
+    requisições gerando o mesmo texto ao mesmo tempo não disputam o mesmo arquivo.
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=TTS_DIR, prefix=f".{filename}.", suffix=".part")
+    os.close(fd)
+    try:
+        yield tmp_name
+        os.replace(tmp_name, TTS_DIR / filename)
+    finally:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+
+def local_tts_available():
+    """O provider local está disponível se o Piper estiver instalado e o modelo existir"""
+    return PiperVoice is not None and LOCAL_TTS_MODEL.exists()
+
+def get_local_voice():
+    """Carrega a voz do Piper uma única vez e mantém em cache"""
+    global _local_voice_cache
+    if _local_voice_cache is None:
+        with _local_voice_lock:
+            if _local_voice_cache is None:
+                if not local_tts_available():
+                    raise Exception(f"TTS local não está disponível. Instale piper-tts e o modelo em {LOCAL_TTS_MODEL}.")
+                print(f"Carregando voz local: {LOCAL_TTS_MODEL.name} (primeira vez)")
+                config_path = str(BASE_DIR / LOCAL_TTS_CONFIG) if LOCAL_TTS_CONFIG else None
+                _local_voice_cache = PiperVoice.load(str(LOCAL_TTS_MODEL), config_path=config_path)
+    return _local_voice_cache
+
+def split_sentences(text):
+    """Divide o texto em frases para sintetizar (e transmitir) uma de cada vez"""
+    return [sentence.strip() for sentence in SENTENCE_END.split(text) if sentence and sentence.strip()]
+
+def _synthesize_pcm(voice, sentence, length_scale):
+    """Áudio PCM 16-bit mono de uma frase, compatível com piper-tts 1.2 e >= 1.3"""
+    if hasattr(voice, 'synthesize_stream_raw'):
+        return b"".join(voice.synthesize_stream_raw(
+            sentence, speaker_id=LOCAL_TTS_SPEAKER, length_scale=length_scale
+        ))
+    from piper import SynthesisConfig
+    syn_config = SynthesisConfig(speaker_id=LOCAL_TTS_SPEAKER, length_scale=length_scale)
+    return b"".join(chunk.audio_int16_bytes for chunk in voice.synthesize(sentence, syn_config=syn_config))
+
+def synthesize_local_sentences(text, length_scale=1.0):
+    """
+    Gera o áudio frase a frase com a voz local
+    
+    Yields:
+        tuple: (frase, bytes PCM 16-bit mono)
+    """
+    voice = get_local_voice()
+    for sentence in split_sentences(clean_text_for_tts(text)):
+        yield sentence, _synthesize_pcm(voice, sentence, length_scale)
+
+def local_sample_rate():
+    return get_local_voice().config.sample_rate
+
+def wav_stream_header(sample_rate):
+    """Cabeçalho WAV com tamanhos máximos, para transmitir áudio de duração desconhecida"""
+    byte_rate = sample_rate * 2
+    return (
+        b'RIFF' + struct.pack('<I', 0xFFFFFFFF) + b'WAVE'
+        + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 1, sample_rate, byte_rate, 2, 16)
+        + b'data' + struct.pack('<I', 0xFFFFFFFF)
+    )
+
+def stream_local_tts(text, length_scale=1.0, on_synthesized=None):
+    """
+    Áudio WAV gerado frase a frase: o cabeçalho sai imediatamente e cada frase é
+    enviada assim que sintetizada, sem esperar o texto inteiro.
+    
+    A síntese roda em uma thread própria e não espera o cliente ler o áudio:
+    `on_synthesized` é chamado quando a última frase fica pronta (ou em erro),
+    mesmo que o envio para um cliente lento ainda não tenha terminado.
+    
+    Returns:
+        iterador: cabeçalho WAV seguido do PCM de cada frase
+    """
+    sample_rate = local_sample_rate()
+    chunks = queue.Queue()
+    
+    def synthesize():
+        total = 0
+        try:
+            with stage("tts_stream"):
+                for _, pcm in synthesize_local_sentences(text, length_scale):
+                    total += len(pcm)
+                    chunks.put(pcm)
+            count_bytes('tts', total)
+        except Exception as e:
+            print(f"Erro no TTS local (stream): {e}")
+        finally:
+            chunks.put(None)
+            if on_synthesized is not None:
+                on_synthesized()
+    
+    threading.Thread(target=synthesize, name="tts-stream", daemon=True).start()
+    
+    def audio():
+        yield wav_stream_header(sample_rate)
+        while True:
+            pcm = chunks.get()
+            if pcm is None:
+                return
+            yield pcm
+    return audio()
+
+def text_to_speech_local(text, length_scale=1.0):
+    """
+    Converte texto em áudio localmente com Piper (Gratuito - Offline na CPU)
+    
+    Args:
+        text (str): Texto para converter
+        length_scale (float): Duração da fala (< 1.0 mais rápido, > 1.0 mais lento)
+    
+    Returns:
+        str: Nome do arquivo gerado ou None se falhar
+    """
+    clean_text = clean_text_for_tts(text)
+    if not clean_text:
+        print("Aviso: Texto vazio após limpeza para TTS")
+        return None
+    
+    filename = tts_cache_filename('local', clean_text, model=LOCAL_TTS_MODEL.name, length_scale=length_scale, ext='wav')
+    if _cached(filename):
+        return filename
+    
+    try:
+        with _atomic_output(filename) as part_path, wave.open(part_path, 'wb') as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(local_sample_rate())
+            for _, pcm in synthesize_local_sentences(clean_text, length_scale):
+                wav_file.writeframes(pcm)
+        return filename
+    
+    except Exception as e:
+        print(f"Erro no TTS local: {e}")
+        return None
+
 def text_to_speech_openai(text, voice='nova', model='tts-1', speed=1.0):
     """
     Converte texto em áudio usando OpenAI TTS (Pago - Alta Qualidade)
@@ -87,9 +291,9 @@ def text_to_speech_openai(text, voice='nova', model='tts-1', speed=1.0):
         print("Aviso: Texto vazio após limpeza para TTS")
         return None
     
-    timestamp = int(time.time() * 1000)
-    filename = f"tts_openai_{timestamp}.mp3"
-    out_path = TTS_DIR / filename
+    filename = tts_cache_filename('openai', clean_text, voice=voice, model=model, speed=speed)
+    if _cached(filename):
+        return filename
     
     try:
         response = openai_client.audio.speech.create(
@@ -100,7 +304,7 @@ def text_to_speech_openai(text, voice='nova', model='tts-1', speed=1.0):
             speed=speed
         )
         
-        with open(out_path, 'wb') as f:
+        with _atomic_output(filename) as part_path, open(part_path, 'wb') as f:
             f.write(response.content)
             
         return filename
@@ -127,13 +331,14 @@ def text_to_speech_gtts(text, lang='en', slow=False):
         print("Aviso: Texto vazio após limpeza para TTS")
         return None
     
-    timestamp = int(time.time() * 1000)
-    filename = f"tts_gtts_{timestamp}.mp3"
-    out_path = TTS_DIR / filename
+    filename = tts_cache_filename('gtts', clean_text, lang=lang, slow=slow)
+    if _cached(filename):
+        return filename
     
     try:
         tts = gTTS(text=clean_text, lang=lang, slow=slow)
-        tts.save(str(out_path))
+        with _atomic_output(filename) as part_path:
+            tts.save(part_path)
         return filename
     
     except Exception as e:
@@ -146,7 +351,7 @@ def text_to_speech(text, provider='auto', **kwargs):
     
     Args:
         text (str): Texto para converter
-        provider (str): 'openai', 'gtts', ou 'auto' (detecta automaticamente)
+        provider (str): 'openai', 'gtts', 'local' ou 'auto' (detecta automaticamente)
         **kwargs: Argumentos específicos para cada provider
     
     Returns:
@@ -156,12 +361,21 @@ def text_to_speech(text, provider='auto', **kwargs):
         print("Aviso: Texto vazio fornecido para TTS")
         return None
     
-    # Auto-detecção: usa OpenAI se disponível, senão gTTS
+    # Auto-detecção: local se preferido, OpenAI se disponível, senão gTTS
     if provider == 'auto':
-        provider = 'openai' if openai_client else 'gtts'
+        provider = resolve_provider(provider)
     
     print(f"🔊 Usando TTS: {provider.upper()}")
     
+    with stage("tts"):
+        filename = _dispatch_tts(text, provider, **kwargs)
+    
+    if filename:
+        count_bytes("tts", (TTS_DIR / filename).stat().st_size)
+    return filename
+
+def _dispatch_tts(text, provider, **kwargs):
+    """Encaminha o texto para o provider de TTS já resolvido"""
     if provider == 'openai':
         if not openai_client:
             print("⚠️  OpenAI TTS não disponível, fallback para gTTS")
@@ -183,48 +397,74 @@ def text_to_speech(text, provider='auto', **kwargs):
         }
         return text_to_speech_gtts(text, **gtts_args)
     
+    elif provider == 'local':
+        if not local_tts_available():
+            print("⚠️  TTS local não disponível, fallback para gTTS")
+            return text_to_speech_gtts(text, lang=kwargs.get('lang', 'zh-cn'))
+        return text_to_speech_local(text, length_scale=kwargs.get('length_scale', 1.0))
+    
     else:
-        raise ValueError(f"Provider '{provider}' não suportado. Use 'openai', 'gtts' ou 'auto'")
+        raise ValueError(f"Provider '{provider}' não suportado. Use 'openai', 'gtts', 'local' ou 'auto'")
 
-def text_to_speech_with_quality(text, provider='auto', quality='normal', lang='en'):
-    """
-    Converte texto em áudio com configurações predefinidas de qualidade
-    
-    Args:
-        text (str): Texto para converter
-        provider (str): 'openai', 'gtts', ou 'auto'
-        quality (str): 'fast', 'normal', 'high' (afeta configurações)
-        lang (str): Idioma para gTTS ('en', 'es', 'fr', 'pt', 'zh', etc.)
-    
-    Returns:
-        str: Nome do arquivo gerado
-    """
+def _quality_params(provider, quality, lang):
+    """Resolve o provider real e os argumentos correspondentes à qualidade pedida"""
     # Configurações por qualidade
     configs = {
         'fast': {
             'openai': {'voice': 'alloy', 'model': 'tts-1', 'speed': 1.25},
-            'gtts': {'lang': lang, 'slow': False}
+            'gtts': {'lang': lang, 'slow': False},
+            'local': {'length_scale': 0.85}
         },
         'normal': {
             'openai': {'voice': 'nova', 'model': 'tts-1', 'speed': 1.0},
-            'gtts': {'lang': lang, 'slow': False}
+            'gtts': {'lang': lang, 'slow': False},
+            'local': {'length_scale': 1.0}
         },
         'high': {
             'openai': {'voice': 'nova', 'model': 'tts-1-hd', 'speed': 1.0},
-            'gtts': {'lang': lang, 'slow': False}
+            'gtts': {'lang': lang, 'slow': False},
+            'local': {'length_scale': 1.0}
         }
     }
     
-    # Detecta provider se auto
-    actual_provider = provider
-    if provider == 'auto':
-        actual_provider = 'openai' if openai_client else 'gtts'
+    # Detecta provider se auto (ou se o escolhido não estiver disponível)
+    actual_provider = resolve_provider(provider)
     
     # Usa configuração apropriada
     config = configs.get(quality, configs['normal'])
-    kwargs = config.get(actual_provider, config['gtts'])
+    return actual_provider, config.get(actual_provider, config['gtts'])
+
+def text_to_speech_with_quality(text, provider='auto', quality='normal', lang='en'):
+    """
+    Converte texto em áudio com configurações predefinidas de qualidade
+    
+    Args:
+        text (str): Texto para converter
+        provider (str): 'openai', 'gtts', 'local' ou 'auto'
+        quality (str): 'fast', 'normal', 'high' (afeta configurações)
+        lang (str): Idioma para gTTS ('en', 'es', 'fr', 'pt', 'zh', etc.)
     
-    return text_to_speech(text, provider=provider, **kwargs)
+    Returns:
+        str: Nome do arquivo gerado
+    """
+    actual_provider, kwargs = _quality_params(provider, quality, lang)
+    return text_to_speech(text, provider=actual_provider, **kwargs)
+
+def get_cached_tts(text, provider='auto', quality='normal', lang='en'):
+    """
+    Verifica se o áudio de `text_to_speech_with_quality` com os mesmos argumentos
+    já está no cache, sem chamar nenhum provider
+    
+    Returns:
+        str: Nome do arquivo em cache ou None
+    """
+    clean_text = clean_text_for_tts(text)
+    if not clean_text:
+        return None
+    actual_provider, kwargs = _quality_params(provider, quality, lang)
+    if actual_provider == 'local':
+        kwargs = {'model': LOCAL_TTS_MODEL.name, 'ext': 'wav', **kwargs}
+    return _cached(tts_cache_filename(actual_provider, clean_text, **kwargs))
 
 def get_tts_info():
     """
@@ -249,6 +489,14 @@ def get_tts_info():
             'speed': 'Médio (2-4s)',
             'voices': ['Padrão'],
             'languages': '100+ idiomas'
+        },
+        'local': {
+            'available': local_tts_available(),
+            'cost': 'Gratuito (offline, CPU)',
+            'quality': 'Boa - Voz neural (Piper)',
+            'speed': 'Rápido, sem rede (síntese por frase)',
+            'voices': [LOCAL_TTS_MODEL.stem],
+            'languages': 'Idioma do modelo (padrão: chinês mandarim)'
         }
     }
 
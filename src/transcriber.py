@@ -1,16 +1,25 @@
-import whisper
 from openai import OpenAI
 from pyhocon import ConfigFactory
 import os, getpass, hashlib
 from dotenv import load_dotenv
 from langchain.chat_models import init_chat_model
 # --- Nova Lógica Baseada em Grafo ---
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import HumanMessage
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import END, MessagesState, StateGraph
 from langgraph.prebuilt import ToolNode, tools_condition
 from src.retriever import Retriever
 from src.vector_db import VectorDb
+from src.metrics import stage, count_tokens
+# STT fica em src.stt (sem efeitos na importação); reexportado aqui por compatibilidade
+from src.stt import (
+    transcribe_audio,
+    transcribe_with_openai,
+    transcribe_with_whisper_local,
+    get_whisper_model,
+    get_stt_hedging_stats,
+)
+from src.prompts import level_system_message, reference_message, trim_to_token_budget, get_encoding
 
 # Carregar variáveis de ambiente
 load_dotenv()
@@ -24,18 +33,15 @@ OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 config = ConfigFactory.parse_file("speakly.conf")
 llm_model = config.get('openai.llm')
 
-# Configurações de STT (Speech-to-Text)
-STT_PROVIDER = config.get('stt.provider', 'openai')
-STT_OPENAI_MODEL = config.get('stt.openai.model', 'whisper-1')
-STT_LANGUAGE = config.get('stt.openai.language', 'en')
-STT_TEMPERATURE = config.get('stt.openai.temperature', 0.0)
-STT_PROMPT = config.get('stt.openai.prompt', 'This is an English conversation for language learning.')
+# Orçamento de tokens para o contexto recuperado inserido no prompt
+CONTEXT_TOKEN_BUDGET = config.get('prompt.context_token_budget', 800)
 
-# Configurações do Whisper local (fallback)
-WHISPER_MODEL = config.get('whisper.model', 'base')
-WHISPER_LANGUAGE = config.get('whisper.language', 'en')  # Inglês
-WHISPER_FP16 = config.get('whisper.fp16', False)
-WHISPER_VERBOSE = config.get('whisper.verbose', False)
+# Diretório com os arquivos de encoding do tiktoken (para rodar sem rede)
+TOKENIZER_CACHE_DIR = config.get('prompt.tokenizer_cache_dir', None)
+if TOKENIZER_CACHE_DIR:
+    os.environ.setdefault('TIKTOKEN_CACHE_DIR', os.path.abspath(TOKENIZER_CACHE_DIR))
+# Carrega o tokenizer na inicialização: problemas aparecem no log de início, não no primeiro turno
+get_encoding(llm_model)
 
 # Configurações para respostas em chinês (apenas para TTS)
 CHINESE_RESPONSE_CONFIG = {
@@ -43,9 +49,6 @@ CHINESE_RESPONSE_CONFIG = {
     'max_tokens': 500,
 }
 
-# Cache do modelo Whisper para evitar recarregar
-_whisper_model_cache = None
-
 # Sistema de memória global para manter histórico de conversas
 _global_memory = MemorySaver()
 _global_graph = None
@@ -82,107 +85,74 @@ def make_generate(user_level):
         return generate(state, user_level)
     return generate_with_level
 
-def get_whisper_model():
-    """Carrega o modelo Whisper uma única vez e mantém em cache"""
-    global _whisper_model_cache
-    if _whisper_model_cache is None:
-        print(f"Carregando modelo Whisper: {WHISPER_MODEL} (primeira vez)")
-        _whisper_model_cache = whisper.load_model(WHISPER_MODEL)
-    return _whisper_model_cache
-
 llm = init_chat_model(llm_model, model_provider="openai")
 
-# Instancie sua base vetorial (vector_db) conforme sua implementação.
-# Exemplo: de uma classe VectorDB ou similar.
-db = VectorDb()
-# Cria a instância do vector_db com os parâmetros necessários
-vector_db = db.add_pdf("book.pdf")
-
-# Instancia o Retriever e extrai o método retrieve para ser usado como ferramenta
-retriever_instance = Retriever(vector_db)
-retrieve = retriever_instance.retrieve
+# Configurações da base vetorial
+VECTOR_DB_SOURCES = config.get('vector_db.sources', [{'path': 'book.pdf', 'themes': ['conversacao-geral']}])
+VECTOR_DB_GENERAL_THEME = config.get('vector_db.general_theme', 'conversacao-geral')
+VECTOR_DB_INDEX_DIR = config.get('vector_db.index_dir', 'temp/vector_index')
+VECTOR_DB_MMAP = config.get('vector_db.mmap', True)
 
-def transcribe_audio(audio_filename):
+def load_vector_db():
     """
-    Transcreve áudio usando OpenAI STT API ou Whisper local como fallback
+    Carrega o índice persistido (via mmap, compartilhável entre workers) ou
+    constrói a partir dos PDFs configurados e salva para as próximas inicializações
     """
-    print(f"Transcrevendo arquivo: {audio_filename}")
-    
-    if STT_PROVIDER == 'openai':
-        return transcribe_with_openai(audio_filename)
-    else:
-        return transcribe_with_whisper_local(audio_filename)
+    if VectorDb.exists(VECTOR_DB_INDEX_DIR):
+        return VectorDb.load(VECTOR_DB_INDEX_DIR, mmap=VECTOR_DB_MMAP)
+    db = VectorDb()
+    for source in VECTOR_DB_SOURCES:
+        path = source.get('path')
+        if not os.path.exists(path):
+            print(f"Aviso: {path} não encontrado, ignorando")
+            continue
+        db.add_pdf(path, themes=source.get('themes', []), sections=source.get('sections', []))
+    if db.index.ntotal == 0:
+        print("Aviso: nenhum documento indexado, base vetorial vazia")
+        return db
+    db.save(VECTOR_DB_INDEX_DIR)
+    # Reabre o índice salvo: o cliente de embeddings usado na construção tem conexões
+    # keep-alive abertas, que não podem ser herdadas pelos workers do gunicorn após o fork
+    return VectorDb.load(VECTOR_DB_INDEX_DIR, mmap=VECTOR_DB_MMAP)
+
+vector_db = load_vector_db()
 
-def transcribe_with_openai(audio_filename):
-    """
-    Transcreve áudio usando a API da OpenAI (Whisper-1)
-    """
-    try:
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        
-        # Preparar parâmetros para a transcrição
-        transcript_params = {
-            "model": STT_OPENAI_MODEL,
-            "file": None,  # será definido abaixo
-            "temperature": STT_TEMPERATURE,
-            "prompt": STT_PROMPT
-        }
-        
-        # Adicionar language apenas se não for null
-        if STT_LANGUAGE and STT_LANGUAGE.lower() != 'null':
-            transcript_params["language"] = STT_LANGUAGE
-        
-        with open(audio_filename, "rb") as audio_file:
-            transcript_params["file"] = audio_file
-            transcript = client.audio.transcriptions.create(**transcript_params)
-        
-        result_text = transcript.text.strip()
-        print(f"Transcrição OpenAI concluída: {result_text}")
-        return result_text
-        
-    except Exception as e:
-        print(f"Erro na transcrição OpenAI: {e}")
-        print("Fallback para Whisper local...")
-        return transcribe_with_whisper_local(audio_filename)
+# Instancia o Retriever e extrai o método retrieve para ser usado como ferramenta
+retriever_instance = Retriever(
+    vector_db,
+    k=config.get('retrieval.k', 2),
+    fetch_k=config.get('retrieval.fetch_k', 20),
+    lambda_mult=config.get('retrieval.lambda_mult', 0.5),
+    general_theme=VECTOR_DB_GENERAL_THEME
+)
+retrieve = retriever_instance.retrieve
 
-def transcribe_with_whisper_local(audio_filename):
-    """
-    Transcreve áudio usando Whisper local (fallback)
-    """
-    print("Usando Whisper local...")
-    
-    # Usa modelo em cache (muito mais rápido)
-    model = get_whisper_model()
-    
-    # Configurações otimizadas para inglês
-    transcribe_options = {
-        "fp16": WHISPER_FP16,
-        "verbose": WHISPER_VERBOSE,
-        "temperature": 0.0,
-    }
-    
-    # Adicionar idioma se especificado
-    if WHISPER_LANGUAGE != "auto":
-        transcribe_options["language"] = WHISPER_LANGUAGE
-    
-    print(f"Iniciando transcrição local com modelo {WHISPER_MODEL}...")
-    result = model.transcribe(audio_filename, **transcribe_options)
-    
-    transcript = result["text"].strip()
-    print(f"Transcrição local concluída: {transcript}")
-    
-    return transcript
+def record_llm_usage(stage_name, message):
+    """Registra o uso de tokens de uma resposta do LangChain (usage_metadata)"""
+    usage = getattr(message, "usage_metadata", None) or {}
+    prompt_tokens = usage.get("input_tokens", 0)
+    completion_tokens = usage.get("output_tokens", 0)
+    cached_tokens = (usage.get("input_token_details") or {}).get("cache_read", 0)
+    count_tokens(stage_name, prompt_tokens, completion_tokens, cached_tokens)
+    print(f"[LOG] Tokens {stage_name}: prompt={prompt_tokens} completion={completion_tokens} cached={cached_tokens}")
 
 # Passo 1: Gerar uma mensagem (possivelmente com chamada de ferramenta)
 def query_or_respond(state: MessagesState):
     """Gera uma chamada de ferramenta para recuperação ou uma resposta."""
-    llm_with_tools = llm.bind_tools([retrieve])
-    response = llm_with_tools.invoke(state["messages"])
+    with stage("query_or_respond"):
+        llm_with_tools = llm.bind_tools([retrieve])
+        response = llm_with_tools.invoke(state["messages"])
+    record_llm_usage("query_or_respond", response)
     return {"messages": [response]}
 
 # Passo 2: Executar a recuperação (nó de ferramenta)
 tools_node = ToolNode([retrieve])
 
+def tools(state: MessagesState):
+    """Executa o nó de ferramentas medindo sua latência."""
+    with stage("tools"):
+        return tools_node.invoke(state)
+
 # Passo 3: Gerar a resposta utilizando o conteúdo recuperado
 def generate(state: MessagesState, user_level="begginer"):
     """Gera a resposta final considerando o nível do usuário."""
@@ -195,38 +165,23 @@ def generate(state: MessagesState, user_level="begginer"):
             break
     tool_messages = recent_tool_messages[::-1]
     
-    # Formata o prompt com o conteúdo dos documentos recuperados
-    docs_content = "\n\n".join(doc.content for doc in tool_messages)
+    # Contexto recuperado limitado ao orçamento de tokens
+    docs_content, context_tokens = trim_to_token_budget(
+        [doc.content for doc in tool_messages], CONTEXT_TOKEN_BUDGET, llm_model
+    )
     print(f"[LOG] Nível do usuário recebido em generate: {user_level}")  # LOG
 
-    # Instrução de nível com ênfase em chinês simplificado (instruções em inglês)
-    level_instruction = {
-        "begginer": "You MUST respond ONLY in Simplified Chinese (简体中文). Use only HSK1 level vocabulary and grammar. Ensure all characters are in Simplified Chinese, never use Traditional Chinese characters.",
-        "intermediate": "You MUST respond ONLY in Simplified Chinese (简体中文). Use HSK1 and HSK2 level vocabulary and grammar. Ensure all characters are in Simplified Chinese, never use Traditional Chinese characters.",
-        "advanced": "You MUST respond ONLY in Simplified Chinese (简体中文). You can use A1 to C2 level vocabulary and grammar. Ensure all characters are in Simplified Chinese, never use Traditional Chinese characters."
-    }.get(user_level, "You MUST respond ONLY in Simplified Chinese (简体中文). Ensure all characters are in Simplified Chinese, never use Traditional Chinese characters.")
-
-    # Prompt do sistema otimizado para conversa contínua (instruções em inglês)
-    system_message_content = (
-        "You are a Chinese language learning assistant specialized in helping learners practice conversation. "
-        "CRITICAL: You MUST always respond ONLY in Simplified Chinese (简体中文). Never use English or any other language in your responses. "
-        "You are knowledgeable about all topics and can discuss anything the user wants to talk about freely. "
-        "Use the following retrieved context to help answer, but feel free to expand beyond it with your general knowledge. "
-        "Keep responses engaging, educational, and conversational. Use 1-3 sentences maximum. "
-        "IMPORTANT: Always respond in a way that continues the conversation naturally. "
-        "Ask follow-up questions or make statements that invite more conversation. "
-        "Never end with polite closings like '如果你需要帮助，请告诉我' or '有什么问题吗？' "
-        "Instead, respond naturally and keep the conversation flowing. "
-        "Strictly follow the user's language level requirements:\n"
-        f"{level_instruction}\n\n"
-        f"Reference Content:\n{docs_content}"
-    )
     conversation_messages = [
         message
         for message in state["messages"]
         if message.type in ("human", "system") or (message.type == "ai" and not message.tool_calls)
     ]
-    prompt = [SystemMessage(system_message_content)] + conversation_messages
+    # Prefixo fixo (instruções + nível) e histórico primeiro, partes variáveis no fim:
+    # assim o início do prompt se repete entre turnos e é aproveitado pelo cache do provider
+    prompt = [level_system_message(user_level)] + conversation_messages
+    if docs_content:
+        prompt.append(reference_message(docs_content))
+        print(f"[LOG] Contexto recuperado: {context_tokens} tokens (orçamento {CONTEXT_TOKEN_BUDGET})")
     
     # Usar configurações específicas para chinês
     llm_params = {
@@ -234,7 +189,9 @@ def generate(state: MessagesState, user_level="begginer"):
         "max_tokens": CHINESE_RESPONSE_CONFIG.get('max_tokens', 500)
     }
     
-    response = llm.invoke(prompt, **llm_params)
+    with stage("generate"):
+        response = llm.invoke(prompt, **llm_params)
+    record_llm_usage("generate", response)
     
     return {"messages": [response]}
 
@@ -243,7 +200,7 @@ def create_graph(user_level="begginer"):
     """Cria um grafo de estados com nível específico"""
     graph_builder = StateGraph(MessagesState)
     graph_builder.add_node(query_or_respond)
-    graph_builder.add_node(tools_node)
+    graph_builder.add_node(tools)
     graph_builder.add_node("generate", make_generate(user_level))
     graph_builder.set_entry_point("query_or_respond")
     graph_builder.add_conditional_edges(
@@ -258,11 +215,12 @@ def create_graph(user_level="begginer"):
     return graph_builder.compile(checkpointer=_global_memory)
 
 # Nova função send_to_llm utilizando o grafo
-def send_to_llm(text, user_level="begginer"):
+def send_to_llm(text, user_level="begginer", theme=None):
     """
     Prepara o estado inicial com o áudio transcrito (text),
     executa o grafo e retorna a resposta gerada.
     Mantém o histórico da conversa usando thread_id persistente.
+    O tema da sessão restringe a recuperação aos trechos marcados com ele.
     """
     global _current_thread_id
     
@@ -273,18 +231,19 @@ def send_to_llm(text, user_level="begginer"):
     initial_messages = [HumanMessage(text)]
     print(f"[LOG] Nível do usuário recebido em send_to_llm: {user_level}")
     print(f"[LOG] Thread ID em uso: {_current_thread_id}")
+    print(f"[LOG] Tema da sessão: {theme}")
 
     state = MessagesState({"messages": initial_messages})
     
     # Usa o thread_id persistente para manter histórico
-    final_state = graph.invoke(state, config={"thread_id": _current_thread_id})
+    final_state = graph.invoke(state, config={"thread_id": _current_thread_id, "theme": theme})
     response_message = final_state["messages"][-1]
     return response_message.content
 
 # A função process_audio_with_llm continua utilizando a transcrição como query para o grafo
-def process_audio_with_llm(audio_filename, user_level):
+def process_audio_with_llm(audio_filename, user_level, theme=None):
     transcript = transcribe_audio(audio_filename)
-    llm_response = send_to_llm(transcript, user_level)
+    llm_response = send_to_llm(transcript, user_level, theme)
     print(f"[LOG] Nível do usuário recebido em process_audio_with_llm: {user_level}")  # LOG
 
     return {
@@ -298,21 +257,27 @@ def translate_text_with_llm(text):
     try:
         client = OpenAI(api_key=OPENAI_API_KEY)
         
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system", 
-                    "content": "You are a professional translator. Translate the following Chinese text to English. Return only the English translation, no explanations or additional text."
-                },
-                {
-                    "role": "user", 
-                    "content": text
-                }
-            ],
-            max_tokens=500,
-            temperature=0.1
-        )
+        with stage("translate"):
+            response = client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {
+                        "role": "system", 
+                        "content": "You are a professional translator. Translate the following Chinese text to English. Return only the English translation, no explanations or additional text."
+                    },
+                    {
+                        "role": "user", 
+                        "content": text
+                    }
+                ],
+                max_tokens=500,
+                temperature=0.1
+            )
+        
+        if response.usage:
+            details = getattr(response.usage, "prompt_tokens_details", None)
+            count_tokens("translate", response.usage.prompt_tokens, response.usage.completion_tokens,
+                         getattr(details, "cached_tokens", 0) or 0)
         
         return response.choices[0].message.content.strip()
         
@@ -1,23 +1,277 @@
+import json
+import os
+import re
+import unicodedata
 import faiss
 import numpy as np
+from langchain_core.documents import Document
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.document_loaders import PyPDFLoader
+from src.metrics import stage
+
+INDEX_FILE = "index.faiss"
+DOCUMENTS_FILE = "documents.json"
+METADATA_FILE = "metadata.npz"
+
+# Leitura via mmap do índice (IndexFlat* só é mapeado a partir do faiss 1.9)
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+# Cada tema ocupa um bit da máscara de temas (uint64)
+MAX_THEMES = 64
+
+
+def normalize_theme(theme):
+    """'Conversação Geral' -> 'conversacao-geral' (sem acentos, minúsculo, hífens)"""
+    if not theme:
+        return ""
+    ascii_text = unicodedata.normalize("NFKD", theme).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "-", ascii_text.lower()).strip("-")
+
+
+def mmr_select(query_vector, candidate_vectors, k, lambda_mult=0.5):
+    """
+    Maximal Marginal Relevance sobre os candidatos: escolhe `k` índices equilibrando
+    relevância para a consulta (peso `lambda_mult`) e diversidade entre si.
+    As similaridades de cosseno são calculadas de uma vez em uma única multiplicação
+    de matrizes; a seleção gulosa só atualiza vetores de tamanho len(candidatos).
+    """
+    n = len(candidate_vectors)
+    if n == 0 or k <= 0:
+        return []
+    k = min(k, n)
+
+    vectors = np.vstack([query_vector, candidate_vectors]).astype(np.float32, copy=False)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarity = vectors[1:] @ vectors.T  # coluna 0: consulta; demais: candidato x candidato
+    relevance = similarity[:, 0]
+    pairwise = similarity[:, 1:]
+
+    selected = [int(np.argmax(relevance))]
+    redundancy = pairwise[selected[0]].copy()  # maior similaridade com algum já escolhido
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+    for _ in range(k - 1):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+    return selected
+
+
+class ChunkMetadata:
+    """
+    Tabela colunar com os metadados de cada vetor do índice (mesma posição = mesmo id):
+    fonte e página como inteiros e os temas como uma máscara de bits.
+    """
+
+    def __init__(self):
+        self.sources = []  # vocabulário: código -> caminho da fonte
+        self.themes = []   # vocabulário: bit -> tema
+        self.source_codes = np.zeros(0, dtype=np.uint16)
+        self.pages = np.zeros(0, dtype=np.int32)
+        self.theme_masks = np.zeros(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.pages)
+
+    def _code(self, vocabulary, value, limit):
+        if value not in vocabulary:
+            if len(vocabulary) >= limit:
+                raise ValueError(f"Limite de {limit} valores distintos atingido ao adicionar '{value}'")
+            vocabulary.append(value)
+        return vocabulary.index(value)
+
+    def theme_bit(self, theme):
+        """Máscara do tema normalizado, ou None se nenhum trecho tiver esse tema"""
+        theme = normalize_theme(theme)
+        if theme not in self.themes:
+            return None
+        return np.uint64(1) << np.uint64(self.themes.index(theme))
+
+    def extend(self, source, pages, themes_per_chunk):
+        source_code = self._code(self.sources, source, np.iinfo(np.uint16).max)
+        masks = []
+        for themes in themes_per_chunk:
+            mask = 0
+            for theme in {normalize_theme(t) for t in themes if normalize_theme(t)}:
+                mask |= 1 << self._code(self.themes, theme, MAX_THEMES)
+            masks.append(mask)
+        self.source_codes = np.concatenate([self.source_codes, np.full(len(pages), source_code, dtype=np.uint16)])
+        self.pages = np.concatenate([self.pages, np.asarray(pages, dtype=np.int32)])
+        self.theme_masks = np.concatenate([self.theme_masks, np.asarray(masks, dtype=np.uint64)])
+
+    def ids_for_theme(self, theme):
+        bit = self.theme_bit(theme)
+        if bit is None:
+            return None
+        return np.flatnonzero(self.theme_masks & bit).astype(np.int64)
+
+    def row(self, i):
+        """Metadados de um trecho no formato de dicionário do LangChain"""
+        mask = int(self.theme_masks[i])
+        return {
+            "source": self.sources[self.source_codes[i]],
+            "page": int(self.pages[i]),
+            "themes": [theme for bit, theme in enumerate(self.themes) if mask >> bit & 1],
+        }
+
+    def save(self, path):
+        np.savez(
+            path,
+            source_codes=self.source_codes,
+            pages=self.pages,
+            theme_masks=self.theme_masks,
+            sources=np.array(self.sources, dtype=object),
+            themes=np.array(self.themes, dtype=object),
+        )
+
+    @classmethod
+    def load(cls, path):
+        metadata = cls()
+        with np.load(path, allow_pickle=True) as data:
+            metadata.source_codes = data["source_codes"]
+            metadata.pages = data["pages"]
+            metadata.theme_masks = data["theme_masks"]
+            metadata.sources = list(data["sources"])
+            metadata.themes = list(data["themes"])
+        return metadata
+
 
 class VectorDb:
     def __init__(self):
         self.embeddings = OpenAIEmbeddings()
         self.dimension = 1536  # Dimensão padrão do OpenAI embeddings
         self.index = faiss.IndexFlatL2(self.dimension)
-        self.documents = []
+        self.texts = []
+        self.metadata = ChunkMetadata()
+        self._theme_params = {}  # cache: tema -> SearchParameters com o seletor de ids
 
-    async def add_pdf(self, pdf_path):
+    def add_pdf(self, pdf_path, themes=(), sections=()):
+        """
+        Indexa um PDF (um trecho por página). `themes` vale para todas as páginas;
+        `sections` adiciona temas a intervalos: [{'pages': '10-25', 'themes': [...]}].
+        Páginas contam a partir de 1, como no leitor de PDF (tanto nas seções quanto
+        nos metadados salvos).
+        """
         loader = PyPDFLoader(pdf_path)
-        pages = []
-        async for page in loader.alazy_load():
-            pages.append(page)
+        pages = list(loader.lazy_load())
         texts = [page.page_content for page in pages]
+        # O PyPDFLoader numera as páginas a partir de 0
+        page_numbers = [page.metadata.get("page", i) + 1 for i, page in enumerate(pages)]
         vectors = self.embeddings.embed_documents(texts)
         vectors_np = np.array(vectors).astype('float32')
         self.index.add(vectors_np)
-        self.documents.extend(pages)
-        print(f"Documento PDF adicionado: {pdf_path}")
\ No newline at end of file
+        self.texts.extend(texts)
+        self.metadata.extend(
+            pdf_path,
+            page_numbers,
+            [list(themes) + _section_themes(sections, page) for page in page_numbers],
+        )
+        self._theme_params.clear()
+        print(f"Documento PDF adicionado: {pdf_path}")
+        return self
+
+    @property
+    def themes(self):
+        return list(self.metadata.themes)
+
+    def _search_params(self, theme):
+        """
+        Restringe a busca aos ids do tema com um seletor do FAISS.
+        Retorna (params, total) ou None se o tema não existir no índice.
+        """
+        key = normalize_theme(theme)
+        if key not in self._theme_params:
+            ids = self.metadata.ids_for_theme(key)
+            if ids is None or len(ids) == 0:
+                self._theme_params[key] = None
+            else:
+                selector = faiss.IDSelectorBatch(ids)
+                self._theme_params[key] = (faiss.SearchParameters(sel=selector), len(ids), selector)
+        cached = self._theme_params[key]
+        return cached[:2] if cached else None
+
+    def _search_ids(self, query, n, theme=None):
+        """Embeda a consulta e busca os `n` ids mais próximos (restritos ao tema, se houver)"""
+        query_vector = np.array([self.embeddings.embed_query(query)], dtype='float32')
+        scoped = self._search_params(theme) if theme else None
+        if scoped:
+            params, total = scoped
+            _, ids = self.index.search(query_vector, min(n, total), params=params)
+        else:
+            _, ids = self.index.search(query_vector, min(n, self.index.ntotal))
+        return query_vector[0], ids[0][ids[0] != -1]
+
+    def document(self, i):
+        return Document(page_content=self.texts[i], metadata=self.metadata.row(i))
+
+    def similarity_search(self, query, k=4, theme=None):
+        """
+        Retorna os `k` documentos mais próximos da consulta. Com `theme`, busca
+        apenas nos trechos desse tema (ou no índice todo se o tema for desconhecido).
+        """
+        if self.index.ntotal == 0:
+            return []
+        _, ids = self._search_ids(query, k, theme)
+        return [self.document(int(i)) for i in ids]
+
+    def max_marginal_relevance_search(self, query, k=2, fetch_k=20, lambda_mult=0.5, theme=None):
+        """
+        Busca `fetch_k` candidatos em uma única chamada ao FAISS e reordena com MMR,
+        evitando devolver páginas quase idênticas. Aceita o mesmo `theme` de similarity_search.
+        """
+        if self.index.ntotal == 0:
+            return []
+        query_vector, candidate_ids = self._search_ids(query, max(k, fetch_k), theme)
+        if len(candidate_ids) == 0:
+            return []
+
+        candidate_vectors = self.index.reconstruct_batch(candidate_ids)
+        with stage("mmr"):
+            order = mmr_select(query_vector, candidate_vectors, k, lambda_mult)
+        return [self.document(int(candidate_ids[i])) for i in order]
+
+    def save(self, index_dir):
+        """Persiste o índice FAISS, os textos e a tabela de metadados em `index_dir`"""
+        os.makedirs(index_dir, exist_ok=True)
+        faiss.write_index(self.index, os.path.join(index_dir, INDEX_FILE))
+        with open(os.path.join(index_dir, DOCUMENTS_FILE), 'w', encoding='utf-8') as f:
+            json.dump(self.texts, f, ensure_ascii=False)
+        self.metadata.save(os.path.join(index_dir, METADATA_FILE))
+        print(f"Índice vetorial salvo em: {index_dir}")
+
+    @classmethod
+    def load(cls, index_dir, mmap=True):
+        """
+        Carrega um índice salvo por `save`. Com `mmap=True` o índice é mapeado
+        somente-leitura, então processos criados por fork compartilham as páginas.
+        """
+        db = cls()
+        flags = MMAP_FLAGS if mmap else 0
+        db.index = faiss.read_index(os.path.join(index_dir, INDEX_FILE), flags)
+        with open(os.path.join(index_dir, DOCUMENTS_FILE), encoding='utf-8') as f:
+            # Índices antigos guardavam os documentos inteiros (texto + metadados)
+            db.texts = [d["page_content"] if isinstance(d, dict) else d for d in json.load(f)]
+        metadata_path = os.path.join(index_dir, METADATA_FILE)
+        if os.path.exists(metadata_path):
+            db.metadata = ChunkMetadata.load(metadata_path)
+        else:
+            db.metadata.extend("desconhecida", list(range(len(db.texts))), [[] for _ in db.texts])
+        print(f"Índice vetorial carregado de: {index_dir} ({db.index.ntotal} vetores, temas: {db.themes})")
+        return db
+
+    @staticmethod
+    def exists(index_dir):
+        return os.path.exists(os.path.join(index_dir, INDEX_FILE))
+
+
+def _section_themes(sections, page):
+    """Temas das seções cujo intervalo de páginas ('10-25' ou '7', a partir de 1) contém `page`"""
+    themes = []
+    for section in sections:
+        first, _, last = str(section.get("pages", "")).partition("-")
+        if first.strip().isdigit() and int(first) <= page <= int(last or first):
+            themes.extend(section.get("themes", []))
+    return themes
@@ -0,0 +1,11 @@
+import pytest
+
+from src import metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    """Cada teste começa com o registro de métricas vazio"""
+    metrics.reset()
+    yield
+    metrics.reset()
@@ -0,0 +1,174 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src import metrics
+from src.hedging import CancelToken, CircuitBreaker, HedgedCaller, LatencyTracker
+
+
+def backend(result=None, delay=0.0, error=None, started=None):
+    """Backend falso: espera `delay`, depois falha com `error` ou devolve `result`"""
+    def run(arg, token):
+        if started is not None:
+            started.append(arg)
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return result
+    return run
+
+
+def caller(primary, secondary, **options):
+    options.setdefault('initial_delay', 0.05)
+    options.setdefault('min_delay', 0.01)
+    return HedgedCaller('test', 'a', 'b', {'a': primary, 'b': secondary}, **options)
+
+
+def test_cancel_token_runs_callbacks_once_and_immediately_after_cancel():
+    token = CancelToken()
+    calls = []
+    token.on_cancel(lambda: calls.append('first'))
+    token.cancel()
+    token.cancel()
+    token.on_cancel(lambda: calls.append('late'))
+    assert calls == ['first', 'late']
+
+
+def test_latency_tracker_uses_initial_delay_until_enough_samples():
+    tracker = LatencyTracker(percentile=50, min_delay=0.1, initial_delay=2.0, min_samples=3)
+    tracker.record(1.0)
+    tracker.record(3.0)
+    assert tracker.hedge_delay() == 2.0
+    tracker.record(5.0)
+    assert tracker.hedge_delay() == 3.0
+
+
+def test_latency_tracker_never_goes_below_min_delay():
+    tracker = LatencyTracker(percentile=95, min_delay=0.5, min_samples=1)
+    tracker.record(0.01)
+    assert tracker.hedge_delay() == 0.5
+
+
+def test_circuit_breaker_opens_after_consecutive_failures_and_half_opens_after_cooldown():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0.05)
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    assert breaker.state == 'closed'  # o sucesso zerou a sequência
+    breaker.failure()
+    assert breaker.state == 'open' and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.state == 'half_open' and breaker.allow()
+    breaker.success()
+    assert breaker.state == 'closed'
+
+
+def test_fast_primary_is_used_without_hedging():
+    started = []
+    hedger = caller(backend('a'), backend('b', started=started))
+    assert hedger.call('clip') == 'a'
+    assert started == []
+    assert hedger.stats()['hedged'] == 0
+
+
+def test_slow_primary_is_hedged_and_loser_is_cancelled():
+    tokens = []
+
+    def slow_primary(arg, token):
+        tokens.append(token)
+        time.sleep(0.3)
+        return 'a'
+
+    hedger = caller(slow_primary, backend('b'))
+    assert hedger.call('clip') == 'b'
+    assert tokens[0].cancelled
+    stats = hedger.stats()
+    assert stats['hedged'] == 1 and stats['hedge_won'] == 1
+    exposition = metrics.render_prometheus()
+    assert 'speakly_test_hedged_total 1' in exposition
+    assert 'speakly_test_hedge_won_total 1' in exposition
+
+
+def test_primary_failure_falls_back_to_secondary():
+    hedger = caller(backend(error=RuntimeError('api fora')), backend('b'))
+    assert hedger.call('clip') == 'b'
+    assert hedger.stats()['fallback'] == 1
+
+
+def test_open_breaker_sends_calls_straight_to_secondary():
+    started = []
+    hedger = caller(backend(error=RuntimeError('api fora'), started=started), backend('b'), failure_threshold=1)
+    hedger.call('clip')
+    assert hedger.call('clip') == 'b'
+    assert started == ['clip']  # a segunda chamada nem tentou o primário
+    assert hedger.stats()['short_circuited'] == 1
+
+
+def test_failures_are_not_recorded_as_latency():
+    hedger = caller(backend(error=RuntimeError('falha rápida')), backend('b', delay=0.01))
+    hedger.call('clip')
+    assert len(hedger.trackers['a'].samples) == 0
+    assert len(hedger.trackers['b'].samples) == 1
+
+
+def test_cancelled_loser_is_recorded_as_a_lower_bound():
+    def interrupted(arg, token):
+        # Como o cliente HTTP fechado pelo cancelamento: falha logo após o cancel
+        while not token.cancelled:
+            time.sleep(0.005)
+        raise ConnectionError('cliente fechado')
+
+    hedger = caller(interrupted, backend('b'))
+    assert hedger.call('clip') == 'b'
+    hedger.executor.shutdown(wait=True)
+    assert len(hedger.trackers['a'].samples) == 1
+    assert hedger.trackers['a'].samples[0] >= 0.05  # pelo menos o atraso do hedge
+    assert hedger.breakers['a'].state == 'closed'  # cancelamento não conta como falha
+
+
+def test_hedge_delay_does_not_fall_when_slow_primary_keeps_losing():
+    hedger = caller(backend('a', delay=0.15), backend('b'), initial_delay=0.05, min_samples=3)
+    delays = []
+    for _ in range(6):
+        hedger.call('clip')
+        hedger.executor.shutdown(wait=True)
+        hedger.executor = ThreadPoolExecutor(max_workers=8)
+        delays.append(hedger.trackers['a'].hedge_delay())
+    # Os perdedores entram no percentil: o atraso sobe até a latência real, nunca cai
+    assert all(later >= earlier for earlier, later in zip(delays, delays[1:]))
+    assert delays[-1] >= 0.15
+
+
+def test_hedge_is_skipped_when_secondary_has_no_free_slot():
+    slot = threading.BoundedSemaphore(1)
+    slot.acquire()  # outra transcrição local ocupa a única vaga
+    started = []
+    hedger = caller(backend('a', delay=0.1), backend('b', started=started), slots={'b': slot})
+    assert hedger.call('clip') == 'a'
+    assert started == []
+    assert hedger.stats()['hedge_skipped'] == 1
+
+
+def test_slot_is_held_until_a_cancelled_loser_finishes():
+    slot = threading.BoundedSemaphore(1)
+    finished = threading.Event()
+
+    def slow_local(arg, token):
+        time.sleep(0.2)
+        finished.set()
+        return 'a'
+
+    hedger = caller(slow_local, backend('b'), slots={'a': slot})
+    assert hedger.call('clip') == 'b'
+    assert not slot.acquire(blocking=False)  # o perdedor ainda roda e segura a vaga
+    assert finished.wait(1)
+    hedger.executor.shutdown(wait=True)
+    assert slot.acquire(blocking=False)
+
+
+def test_error_is_raised_when_both_backends_fail():
+    hedger = caller(backend(error=RuntimeError('a'), delay=0.1), backend(error=RuntimeError('b')))
+    with pytest.raises(RuntimeError):
+        hedger.call('clip')
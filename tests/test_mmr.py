@@ -0,0 +1,68 @@
+import numpy as np
+
+from src.vector_db import mmr_select
+
+
+def reference_mmr(query, candidates, k, lambda_mult):
+    """MMR ingênuo, candidato por candidato, para comparar com a versão vetorizada"""
+    def cosine(a, b):
+        return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+    selected = []
+    remaining = list(range(len(candidates)))
+    while remaining and len(selected) < k:
+        def score(i):
+            redundancy = max((cosine(candidates[i], candidates[j]) for j in selected), default=0.0)
+            relevance = cosine(query, candidates[i])
+            return lambda_mult * relevance - (1 - lambda_mult) * redundancy if selected else relevance
+        best = max(remaining, key=score)
+        selected.append(best)
+        remaining.remove(best)
+    return selected
+
+
+def test_empty_candidates_or_zero_k_select_nothing():
+    query = np.ones(4, dtype=np.float32)
+    assert mmr_select(query, np.zeros((0, 4), dtype=np.float32), 2) == []
+    assert mmr_select(query, np.eye(4, dtype=np.float32), 0) == []
+
+
+def test_k_larger_than_candidates_returns_each_candidate_once():
+    rng = np.random.default_rng(1)
+    candidates = rng.standard_normal((3, 8), dtype=np.float32)
+    selected = mmr_select(rng.standard_normal(8, dtype=np.float32), candidates, 10)
+    assert sorted(selected) == [0, 1, 2]
+
+
+def test_near_duplicate_is_skipped_in_favour_of_a_diverse_candidate():
+    query = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+    candidates = np.array([
+        [0.95, 0.31, 0.0],   # mais relevante
+        [0.90, 0.41, 0.02],  # quase idêntico ao primeiro
+        [0.70, 0.0, 0.71],   # menos relevante, mas diferente
+    ], dtype=np.float32)
+    assert mmr_select(query, candidates, 2, lambda_mult=0.5) == [0, 2]
+
+
+def test_lambda_one_is_plain_relevance_order():
+    rng = np.random.default_rng(2)
+    query = rng.standard_normal(16, dtype=np.float32)
+    candidates = rng.standard_normal((20, 16), dtype=np.float32)
+    cosine = candidates @ query / (np.linalg.norm(candidates, axis=1) * np.linalg.norm(query))
+    assert mmr_select(query, candidates, 5, lambda_mult=1.0) == list(np.argsort(-cosine)[:5])
+
+
+def test_matches_reference_implementation():
+    rng = np.random.default_rng(3)
+    for lambda_mult in (0.0, 0.3, 0.5, 0.8):
+        query = rng.standard_normal(32, dtype=np.float32)
+        candidates = rng.standard_normal((25, 32), dtype=np.float32)
+        assert mmr_select(query, candidates, 6, lambda_mult) == reference_mmr(query, candidates, 6, lambda_mult)
+
+
+def test_candidate_vectors_are_not_modified():
+    rng = np.random.default_rng(4)
+    candidates = rng.standard_normal((5, 8), dtype=np.float32)
+    original = candidates.copy()
+    mmr_select(rng.standard_normal(8, dtype=np.float32), candidates, 3)
+    np.testing.assert_array_equal(candidates, original)
@@ -0,0 +1,56 @@
+import pytest
+
+from src import prompts
+from src.prompts import CharEstimateEncoding, trim_to_token_budget
+
+MODEL = "test-model"
+
+
+@pytest.fixture(autouse=True)
+def char_encoding(monkeypatch):
+    # Sem rede nos testes: o modelo de teste usa a estimativa por caracteres
+    monkeypatch.setitem(prompts._encoding_cache, MODEL, CharEstimateEncoding())
+
+
+def test_chunks_that_fit_are_kept_whole_in_relevance_order():
+    text, used = trim_to_token_budget(["你好", "世界"], 10, MODEL)
+    assert text == "你好\n\n世界"
+    assert used == 5  # 2 + separador (1) + 2
+
+
+def test_chunk_over_budget_is_cut_and_later_chunks_are_dropped():
+    text, used = trim_to_token_budget(["你好", "世界再见", "谢谢"], 5, MODEL)
+    assert text == "你好\n\n世界"
+    assert used == 5
+
+
+def test_zero_budget_keeps_nothing():
+    assert trim_to_token_budget(["你好"], 0, MODEL) == ("", 0)
+
+
+def test_used_tokens_never_exceed_the_budget():
+    chunks = ["学习中文需要时间和耐心。" * 3, "every day a little practice", "你会进步得很快"]
+    for budget in range(0, 60, 7):
+        _, used = trim_to_token_budget(chunks, budget, MODEL)
+        assert used <= budget
+
+
+def test_char_estimate_round_trips_and_counts_cjk_per_character():
+    encoding = CharEstimateEncoding()
+    text = "你好, hello world!"
+    tokens = encoding.encode(text)
+    assert encoding.decode(tokens) == text
+    assert tokens[:2] == ["你", "好"]
+
+
+def test_missing_tokenizer_falls_back_to_char_estimate(monkeypatch):
+    def offline(*args, **kwargs):
+        raise ConnectionError("sem rede")
+
+    monkeypatch.setattr(prompts.tiktoken, "encoding_for_model", offline)
+    monkeypatch.setattr(prompts.tiktoken, "get_encoding", offline)
+    monkeypatch.delitem(prompts._encoding_cache, "offline-model", raising=False)
+
+    assert isinstance(prompts.get_encoding("offline-model"), CharEstimateEncoding)
+    text, used = trim_to_token_budget(["你好"], 10, "offline-model")
+    assert (text, used) == ("你好", 2)
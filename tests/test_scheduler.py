@@ -0,0 +1,144 @@
+import threading
+import time
+
+import pytest
+
+from src import scheduler
+from src.scheduler import Overloaded, StageLimiter
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condição não atingida a tempo")
+        time.sleep(0.005)
+
+
+def queued(limiter):
+    with limiter._cond:
+        return len(limiter._waiting)
+
+
+def start_waiter(limiter, priority, order):
+    def run():
+        limiter.acquire(priority)
+        order.append(priority)
+        limiter.release()
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+@pytest.fixture(autouse=True)
+def restore_scheduler():
+    limiters, enabled = dict(scheduler._limiters), scheduler._enabled
+    yield
+    scheduler._limiters.clear()
+    scheduler._limiters.update(limiters)
+    scheduler._enabled = enabled
+
+
+def test_waiters_are_served_in_priority_order():
+    limiter = StageLimiter('stt', concurrency=1, max_queue=8, max_wait=5)
+    limiter.acquire()
+    order = []
+    priorities = [scheduler.recording_priority(300), scheduler.recording_priority(100), scheduler.TRANSLATE_PRIORITY]
+    threads = []
+    for count, priority in enumerate(priorities, 1):
+        threads.append(start_waiter(limiter, priority, order))
+        wait_until(lambda: queued(limiter) == count)
+
+    limiter.release()
+    for thread in threads:
+        thread.join(2)
+
+    assert order == [(0, 0), (1, 100), (1, 300)]
+
+
+def test_full_queue_is_rejected_with_429():
+    limiter = StageLimiter('llm', concurrency=1, max_queue=1, max_wait=5)
+    limiter.acquire()
+    order = []
+    waiter = start_waiter(limiter, (1, 0), order)
+    wait_until(lambda: queued(limiter) == 1)
+
+    with pytest.raises(Overloaded) as error:
+        limiter.acquire()
+    assert error.value.status == 429
+    assert error.value.stage_name == 'llm'
+
+    limiter.release()
+    waiter.join(2)
+    assert order == [(1, 0)]
+
+
+def test_admit_rejects_before_any_work_when_a_stage_is_full():
+    scheduler.configure({'stt': {'concurrency': 1, 'queue': 0}, 'tts': {'concurrency': 1, 'queue': 4}})
+    scheduler._limiters['stt'].acquire()
+
+    scheduler.admit('tts')
+    with pytest.raises(Overloaded) as error:
+        scheduler.admit('stt', 'tts')
+    assert error.value.status == 429
+    assert error.value.stage_name == 'stt'
+
+
+def test_wait_past_max_wait_is_rejected_with_503_and_leaves_the_queue():
+    limiter = StageLimiter('tts', concurrency=1, max_queue=4, max_wait=0.05)
+    limiter.acquire()
+
+    with pytest.raises(Overloaded) as error:
+        limiter.acquire()
+    assert error.value.status == 503
+    assert queued(limiter) == 0
+
+    limiter.release()
+    limiter.acquire()  # a vaga liberada continua utilizável
+    limiter.release()
+
+
+def test_retry_after_follows_service_time_and_backlog():
+    limiter = StageLimiter('stt', concurrency=2, max_queue=0, max_wait=5)
+    assert limiter.retry_after() == 1  # nunca menos de 1s
+
+    for _ in range(2):
+        limiter.acquire()
+    limiter.release(held_seconds=10.0)  # EWMA: 0.8 * 1.0 + 0.2 * 10.0 = 2.8s
+    limiter.acquire()
+
+    with pytest.raises(Overloaded) as error:
+        limiter.acquire()
+    # Uma requisição na frente (a própria) dividida por 2 vagas: ceil(2.8 / 2)
+    assert error.value.retry_after == 2
+    assert '2s' in str(error.value)
+
+
+def test_slot_releases_on_exception():
+    limiter = StageLimiter('llm', concurrency=1, max_queue=0, max_wait=5)
+    with pytest.raises(ValueError):
+        with limiter.slot():
+            raise ValueError("falha na etapa")
+    limiter.acquire()  # não levanta 429: a vaga foi devolvida
+    limiter.release()
+
+
+def test_disabled_scheduler_does_not_limit():
+    scheduler.configure({'stt': {'concurrency': 1, 'queue': 0}}, enabled=False)
+    with scheduler.slot('stt'), scheduler.slot('stt'):
+        scheduler.admit('stt')
+
+
+def test_acquire_returns_a_release_that_works_once_from_any_thread():
+    scheduler.configure({'tts': {'concurrency': 1, 'queue': 0}})
+    release = scheduler.acquire('tts')
+    with pytest.raises(Overloaded):
+        scheduler.acquire('tts')
+
+    thread = threading.Thread(target=release)
+    thread.start()
+    thread.join(2)
+    release()  # segunda chamada não libera uma vaga a mais
+
+    scheduler.acquire('tts')
+    assert scheduler.status()['tts']['active'] == 1